@@ -1,7 +1,13 @@
 import os
+import time
+import asyncio
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
 import httpx  # Библиотека для асинхронных HTTP запросов
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel, Field
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from dotenv import load_dotenv  # Для загрузки переменных из .env файла
 
 # Загружаем переменные окружения из .env файла
@@ -21,83 +27,427 @@ app.add_middleware(
 
 # Получение API ключа и базового URL
 API_KEY = os.getenv("OPENWEATHER_API_KEY")
-WEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5/weather"
-FORECAST_BASE_URL = "https://api.openweathermap.org/data/2.5/forecast"
+# Базовый URL можно подменить на локальную заглушку (см. stub_upstream.py)
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+WEATHER_BASE_URL = f"{OPENWEATHER_BASE_URL}/weather"
+FORECAST_BASE_URL = f"{OPENWEATHER_BASE_URL}/forecast"
+UPSTREAM_TIMEOUT = float(os.getenv("WEATHER_UPSTREAM_TIMEOUT", "3"))  # в секундах
 
-# --- Эндпоинт для текущей погоды ---
-@app.get("/api/weather/{city}")
-async def get_weather(city: str):
-    if not API_KEY:
-        raise HTTPException(status_code=500, detail="API key is not configured")
+# --- Кэш текущей погоды ---
+# Пример: {"place:2643743": (время_сохранения, {"city_name": ..., "temperature": ...})}
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))  # в секундах
+# Сколько ещё можно отдавать устаревшее значение, пока оно обновляется в фоне
+WEATHER_STALE_TTL = int(os.getenv("WEATHER_STALE_TTL", "86400"))  # в секундах
+# Сколько ключей держать: при переполнении вытесняются давно не читавшиеся
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "10000"))
+weather_cache: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+# Ключи, для которых уже идёт фоновое обновление
+refreshing: Set[str] = set()
+# Ссылки на фоновые задачи: без них задачу может собрать сборщик мусора посреди запроса
+background_refreshes: Set[asyncio.Task] = set()
+
+# --- Ограничения для пакетного запроса ---
+BATCH_MAX_ITEMS = 100
+BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", "10"))
+BATCH_TIMEOUT = float(os.getenv("WEATHER_BATCH_TIMEOUT", "10"))  # в секундах
+
+# --- Геохэш для координат ---
+# Точность 6 символов ~ 1.2 x 0.6 км: соседние клиенты попадают в одну ячейку
+GEOHASH_PRECISION = int(os.getenv("WEATHER_GEOHASH_PRECISION", "6"))
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Ключ запроса (ячейка геохэша или город) -> ключ кэша места, в которое он разрешился (LRU)
+PLACE_ALIAS_MAX_ENTRIES = int(os.getenv("WEATHER_PLACE_ALIAS_MAX_ENTRIES", "100000"))
+place_aliases: "OrderedDict[str, str]" = OrderedDict()
+
+
+# --- Предохранитель (circuit breaker) для OpenWeatherMap ---
+class CircuitBreaker:
+    """После failure_threshold ошибок подряд перестаёт ходить в сервис на reset_timeout секунд,
+    затем пропускает один пробный запрос."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
 
-    # Параметры для запроса к OpenWeatherMap
-    params = {
-        "q": city,
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def abandon_trial(self):
+        # Пробный запрос отменён, не дождавшись ответа
+        self.trial_in_flight = False
+
+upstream_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("WEATHER_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("WEATHER_BREAKER_RESET", "30")),
+)
+
+
+# --- Pydantic модели для пакетного запроса ---
+class Coords(BaseModel):
+    # Вне диапазона геохэш прижал бы точку к краю карты и завёл бы для неё запись кэша
+    lat: float = Field(ge=-90, le=90, allow_inf_nan=False)
+    lon: float = Field(ge=-180, le=180, allow_inf_nan=False)
+
+class BatchWeatherRequest(BaseModel):
+    cities: List[str] = []
+    coords: List[Coords] = []
+
+class BatchWeatherItem(BaseModel):
+    query: str
+    data: Optional[dict] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+
+
+# --- Вспомогательные функции ---
+def build_params(**query) -> dict:
+    """Общие параметры запроса к OpenWeatherMap."""
+    return {
+        **query,
         "appid": API_KEY,
         "units": "metric",  # для получения температуры в Цельсиях
         "lang": "ru"        # для получения описания на русском
     }
 
+def parse_weather(data: dict) -> dict:
+    """Выбирает из ответа OpenWeatherMap только нужную нам часть данных."""
+    return {
+        "city_name": data["name"],
+        "temperature": data["main"]["temp"],
+        "description": data["weather"][0]["description"],
+        "icon": data["weather"][0]["icon"]
+    }
+
+def city_cache_key(city: str) -> str:
+    return f"city:{city.strip().lower()}"
+
+def geohash_encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Кодирует координаты в геохэш заданной длины."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # чётные биты кодируют долготу, нечётные - широту
+
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+def geohash_center(geohash: str) -> Tuple[float, float]:
+    """Возвращает центр ячейки геохэша (широта, долгота)."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        bits = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (bits >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+def coords_cache_key(geohash: str) -> str:
+    return f"geo:{geohash}"
+
+def place_cache_key(data: dict) -> Optional[str]:
+    """Ключ места по id OpenWeatherMap: в отличие от name, он не зависит от lang."""
+    place_id = data.get("id")
+    return f"place:{place_id}" if place_id else None
+
+def remember_lru(cache: OrderedDict, key: str, value, max_entries: int):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_entries:
+        cache.popitem(last=False)
+
+def cache_get(key: str) -> Tuple[Optional[dict], bool]:
+    """Возвращает (значение, свежее ли оно). Устаревшее значение отдаётся до WEATHER_STALE_TTL."""
+    cached = weather_cache.get(key)
+    if cached:
+        age = time.monotonic() - cached[0]
+        if age < WEATHER_CACHE_TTL + WEATHER_STALE_TTL:
+            weather_cache.move_to_end(key)
+            return cached[1], age < WEATHER_CACHE_TTL
+        # Совсем старое значение уже не отдаётся - освобождаем место
+        del weather_cache[key]
+    return None, False
+
+def cache_set(key: str, value: dict):
+    remember_lru(weather_cache, key, (time.monotonic(), value), WEATHER_CACHE_MAX_ENTRIES)
+
+async def fetch_json(client: httpx.AsyncClient, url: str, params: dict, not_found_detail: str, error_detail: str) -> dict:
+    """Запрос к OpenWeatherMap с единой обработкой ошибок и предохранителем."""
+    if not upstream_breaker.allow_request():
+        raise HTTPException(status_code=503, detail="Weather service is temporarily unavailable")
+
+    try:
+        response = await client.get(url, params=params, timeout=UPSTREAM_TIMEOUT)
+    except httpx.TimeoutException:
+        upstream_breaker.record_failure()
+        raise HTTPException(status_code=504, detail="Weather service timed out")
+    except httpx.HTTPError as e:
+        upstream_breaker.record_failure()
+        raise HTTPException(status_code=502, detail=f"Weather service is unreachable: {e}")
+    except asyncio.CancelledError:
+        upstream_breaker.abandon_trial()
+        raise
+
+    # 5xx и 429 - проблема сервиса, 404 и прочие 4xx - проблема запроса
+    if response.status_code >= 500 or response.status_code == 429:
+        upstream_breaker.record_failure()
+    else:
+        upstream_breaker.record_success()
+
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    if response.status_code != 200:
+        # Возвращаем текст ошибки от самого API OpenWeather
+        try:
+            detail = response.json().get("message", error_detail)
+        except ValueError:
+            detail = error_detail
+        status_code = 502 if response.status_code >= 500 else response.status_code
+        raise HTTPException(status_code=status_code, detail=detail)
+
+    return response.json()
+
+def resolve_cache_key(cache_key: str) -> str:
+    """Город или ячейка геохэша, уже разрешённые в место, читают кэш этого места."""
+    place_key = place_aliases.get(cache_key)
+    if place_key is None:
+        return cache_key
+    place_aliases.move_to_end(cache_key)
+    return place_key
+
+def lookup_cached(cache_key: str, params: dict, not_found_detail: str) -> Optional[dict]:
+    """Значение из кэша. Устаревшее отдаётся сразу, а обновление запускается в фоне."""
+    value, fresh = cache_get(resolve_cache_key(cache_key))
+    if value is not None and not fresh:
+        schedule_refresh(cache_key, lambda client: refresh_weather(client, cache_key, params, not_found_detail))
+    return value
+
+def schedule_refresh(cache_key: str, refresh: Callable[[httpx.AsyncClient], Awaitable[dict]]):
+    """Запускает refresh(client) в фоне, не больше одного обновления на ключ."""
+    # Пока предохранитель разомкнут, не тратим задачи на заведомо неудачные запросы
+    if cache_key in refreshing or upstream_breaker.state == "open":
+        return
+    refreshing.add(cache_key)
+    task = asyncio.create_task(refresh_in_background(cache_key, refresh))
+    background_refreshes.add(task)
+    task.add_done_callback(background_refreshes.discard)
+
+async def refresh_in_background(cache_key: str, refresh: Callable[[httpx.AsyncClient], Awaitable[dict]]):
     try:
-        # Асинхронно запрашиваем данные с погодного сервиса
         async with httpx.AsyncClient() as client:
-            response = await client.get(WEATHER_BASE_URL, params=params)
+            await refresh(client)
+    except Exception:
+        # Клиент уже получил устаревшее значение, попробуем в следующий раз
+        pass
+    finally:
+        refreshing.discard(cache_key)
 
-        # Обработка ошибок
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail="City not found")
-        if response.status_code != 200:
-            # Возвращаем текст ошибки от самого API OpenWeather
-            error_detail = response.json().get("message", "Error fetching weather data")
-            raise HTTPException(status_code=response.status_code, detail=error_detail)
+async def fetch_weather(client: httpx.AsyncClient, cache_key: str, params: dict, not_found_detail: str) -> dict:
+    """Текущая погода: сначала кэш (в том числе устаревший), затем OpenWeatherMap."""
+    cached = lookup_cached(cache_key, params, not_found_detail)
+    if cached is not None:
+        return cached
+    return await refresh_weather(client, cache_key, params, not_found_detail)
 
-        data = response.json()
+async def refresh_weather(client: httpx.AsyncClient, cache_key: str, params: dict, not_found_detail: str) -> dict:
+    data = await fetch_json(client, WEATHER_BASE_URL, params, not_found_detail, "Error fetching weather data")
+    relevant_data = parse_weather(data)
 
-        # Возвращаем только нужную нам часть данных
-        relevant_data = {
-            "city_name": data["name"],
-            "temperature": data["main"]["temp"],
-            "description": data["weather"][0]["description"],
-            "icon": data["weather"][0]["icon"]
-        }
+    place_key = place_cache_key(data)
+    if place_key:
+        # Город и соседние ячейки, разрешившиеся в одно место, делят одну запись кэша
+        remember_lru(place_aliases, cache_key, place_key, PLACE_ALIAS_MAX_ENTRIES)
+        cache_set(place_key, relevant_data)
+    else:
+        cache_set(cache_key, relevant_data)
+    return relevant_data
 
-        return relevant_data
+async def fetch_forecast(city: str) -> dict:
+    """Сырой прогноз из кэша или OpenWeatherMap. Устаревший отдаётся сразу и обновляется в фоне."""
+    cache_key = f"forecast:{city.strip().lower()}"
+    cached, fresh = cache_get(cache_key)
+    if cached is not None:
+        if not fresh:
+            schedule_refresh(cache_key, lambda client: refresh_forecast(client, city, cache_key))
+        return cached
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # Асинхронно запрашиваем данные с погодного сервиса
+    async with httpx.AsyncClient() as client:
+        return await refresh_forecast(client, city, cache_key)
 
-# --- Эндпоинт для прогноза на 5 дней ---
-@app.get("/api/forecast/{city}")
-async def get_forecast(city: str):
+async def refresh_forecast(client: httpx.AsyncClient, city: str, cache_key: str) -> dict:
+    data = await fetch_json(client, FORECAST_BASE_URL, build_params(q=city), "City not found", "Error fetching forecast data")
+    entry = {
+        "city_name": data["city"]["name"],
+        "timezone": data["city"].get("timezone", 0),  # смещение от UTC в секундах
+        "slots": data["list"],
+        "daily": None,
+    }
+    cache_set(cache_key, entry)
+    return entry
+
+def aggregate_daily(slots: List[dict], tz_offset: int) -> List[dict]:
+    """Сводка по локальным дням за один проход по всем ~40 интервалам прогноза."""
+    days: Dict[str, dict] = {}
+
+    for item in slots:
+        day = datetime.fromtimestamp(item["dt"] + tz_offset, tz=timezone.utc).date().isoformat()
+        temp = item["main"]["temp"]
+        weather = item["weather"][0]
+        precipitation = item.get("rain", {}).get("3h", 0) + item.get("snow", {}).get("3h", 0)
+
+        stats = days.get(day)
+        if stats is None:
+            stats = days[day] = {
+                "date": day,
+                "temp_min": temp,
+                "temp_max": temp,
+                "temp_sum": 0.0,
+                "count": 0,
+                "precipitation": 0.0,
+                "conditions": Counter(),
+                "icons": {},
+            }
+
+        stats["temp_min"] = min(stats["temp_min"], temp)
+        stats["temp_max"] = max(stats["temp_max"], temp)
+        stats["temp_sum"] += temp
+        stats["count"] += 1
+        stats["precipitation"] += precipitation
+        stats["conditions"][weather["description"]] += 1
+        stats["icons"].setdefault(weather["description"], weather["icon"])
+
+    daily = []
+    for stats in days.values():
+        description = stats["conditions"].most_common(1)[0][0]
+        daily.append({
+            "date": stats["date"],
+            "temp_min": stats["temp_min"],
+            "temp_max": stats["temp_max"],
+            "temp_mean": round(stats["temp_sum"] / stats["count"], 1),
+            "description": description,
+            "icon": stats["icons"][description],
+            "precipitation": round(stats["precipitation"], 2),
+        })
+    return daily
+
+def coords_query(lat: float, lon: float) -> Tuple[str, dict]:
+    """Привязывает координаты к центру ячейки геохэша: ключ кэша и параметры запроса."""
+    geohash = geohash_encode(lat, lon)
+    center_lat, center_lon = geohash_center(geohash)
+    return coords_cache_key(geohash), build_params(lat=round(center_lat, 5), lon=round(center_lon, 5))
+
+def require_api_key():
     if not API_KEY:
         raise HTTPException(status_code=500, detail="API key is not configured")
 
-    # Параметры для запроса к OpenWeatherMap для прогноза
-    params = {
-        "q": city,
-        "appid": API_KEY,
-        "units": "metric",  # для получения температуры в Цельсиях
-        "lang": "ru",       # для получения описания на русском
-    }
+
+# --- Новый эндпоинт для погоды по географическим координатам ---
+# Объявлен раньше /api/weather/{city}, иначе "coords" примется за название города
+@app.get("/api/weather/coords")
+async def get_weather_by_coords(
+    lat: float = Query(ge=-90, le=90, allow_inf_nan=False),
+    lon: float = Query(ge=-180, le=180, allow_inf_nan=False),
+):
+    require_api_key()
+
+    try:
+        cache_key, params = coords_query(lat, lon)
+        async with httpx.AsyncClient() as client:
+            return await fetch_weather(client, cache_key, params, "Location not found")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- Эндпоинт для текущей погоды ---
+@app.get("/api/weather/{city}")
+async def get_weather(city: str):
+    require_api_key()
 
     try:
         # Асинхронно запрашиваем данные с погодного сервиса
         async with httpx.AsyncClient() as client:
-            response = await client.get(FORECAST_BASE_URL, params=params)
+            return await fetch_weather(client, city_cache_key(city), build_params(q=city), "City not found")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- Эндпоинт для прогноза на 5 дней ---
+# mode=slots - ближайшие 3-часовые интервалы, mode=daily - сводка по дням
+@app.get("/api/forecast/{city}")
+async def get_forecast(city: str, mode: str = "slots"):
+    require_api_key()
+    if mode not in ("slots", "daily"):
+        raise HTTPException(status_code=400, detail="mode must be 'slots' or 'daily'")
 
-        # Обработка ошибок
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail="City not found")
-        if response.status_code != 200:
-            # Возвращаем текст ошибки от самого API OpenWeather
-            error_detail = response.json().get("message", "Error fetching forecast data")
-            raise HTTPException(status_code=response.status_code, detail=error_detail)
+    try:
+        entry = await fetch_forecast(city)
 
-        data = response.json()
+        if mode == "daily":
+            # Сводка считается один раз и хранится рядом с сырым прогнозом
+            if entry["daily"] is None:
+                entry["daily"] = aggregate_daily(entry["slots"], entry["timezone"])
+            return {"city_name": entry["city_name"], "daily": entry["daily"]}
 
-        # Собираем данные для прогноза на 5 дней (по 3 часа)
+        # Собираем данные для прогноза (по 3 часа)
         forecast_data = []
-        for item in data["list"][:5]:  # Just taking 5 data points for 5 days
+        for item in entry["slots"][:5]:
             forecast_data.append({
                 "date": item["dt_txt"],
                 "temperature": item["main"]["temp"],
@@ -105,50 +455,75 @@ async def get_forecast(city: str):
                 "icon": item["weather"][0]["icon"]
             })
 
-        return {"city_name": data["city"]["name"], "forecast": forecast_data}
+        return {"city_name": entry["city_name"], "forecast": forecast_data}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# --- Новый эндпоинт для погоды по географическим координатам ---
-@app.get("/api/weather/coords")
-async def get_weather_by_coords(lat: float, lon: float):
-    if not API_KEY:
-        raise HTTPException(status_code=500, detail="API key is not configured")
+# --- Пакетный эндпоинт: погода сразу для многих городов и координат ---
+@app.post("/api/weather/batch", response_model=List[BatchWeatherItem])
+async def get_weather_batch(request: BatchWeatherRequest):
+    require_api_key()
 
-    # Параметры для запроса к OpenWeatherMap по координатам
-    params = {
-        "lat": lat,
-        "lon": lon,
-        "appid": API_KEY,
-        "units": "metric",  # для получения температуры в Цельсиях
-        "lang": "ru"        # для получения описания на русском
-    }
+    # (метка запроса, ключ кэша, параметры, текст ошибки 404)
+    queries = [
+        (city, city_cache_key(city), build_params(q=city), "City not found")
+        for city in request.cities
+    ] + [
+        (f"{c.lat},{c.lon}", *coords_query(c.lat, c.lon), "Location not found")
+        for c in request.coords
+    ]
+    if len(queries) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many items. Max is {BATCH_MAX_ITEMS}.")
 
-    try:
-        # Асинхронно запрашиваем данные с погодного сервиса
-        async with httpx.AsyncClient() as client:
-            response = await client.get(WEATHER_BASE_URL, params=params)
+    results: List[Optional[BatchWeatherItem]] = [None] * len(queries)
+    pending = []
 
-        # Обработка ошибок
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Location not found")
-        if response.status_code != 200:
-            # Возвращаем текст ошибки от самого API OpenWeather
-            error_detail = response.json().get("message", "Error fetching weather data")
-            raise HTTPException(status_code=response.status_code, detail=error_detail)
+    # Ответы из кэша отдаём сразу, не занимая место в пуле запросов
+    for i, (label, cache_key, params, not_found_detail) in enumerate(queries):
+        cached = lookup_cached(cache_key, params, not_found_detail)
+        if cached is not None:
+            results[i] = BatchWeatherItem(query=label, data=cached)
+        else:
+            pending.append(i)
 
-        data = response.json()
+    if pending:
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
 
-        # Возвращаем только нужную нам часть данных
-        relevant_data = {
-            "city_name": data["name"],
-            "temperature": data["main"]["temp"],
-            "description": data["weather"][0]["description"],
-            "icon": data["weather"][0]["icon"]
-        }
+        async with httpx.AsyncClient() as client:
+            async def run(i: int):
+                label, cache_key, params, not_found_detail = queries[i]
+                try:
+                    async with semaphore:
+                        data = await fetch_weather(client, cache_key, params, not_found_detail)
+                    results[i] = BatchWeatherItem(query=label, data=data)
+                except HTTPException as e:
+                    results[i] = BatchWeatherItem(query=label, error=e.detail, status_code=e.status_code)
+                except Exception as e:
+                    results[i] = BatchWeatherItem(query=label, error=str(e), status_code=500)
 
-        return relevant_data
+            tasks = [asyncio.create_task(run(i)) for i in pending]
+            # Один медленный город не должен задерживать весь ответ
+            _, not_done = await asyncio.wait(tasks, timeout=BATCH_TIMEOUT)
+            for task in not_done:
+                task.cancel()
+            # Отменённые задачи должны завершиться до закрытия клиента
+            await asyncio.gather(*not_done, return_exceptions=True)
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        for i in pending:
+            if results[i] is None:
+                results[i] = BatchWeatherItem(query=queries[i][0], error="Upstream timeout", status_code=504)
+
+    return results
+
+# --- Состояние предохранителя ---
+@app.get("/api/weather-health")
+async def weather_health():
+    return {
+        "breaker_state": upstream_breaker.state,
+        "consecutive_failures": upstream_breaker.failures,
+        "cached_entries": len(weather_cache),
+        "refreshing": len(refreshing),
+    }
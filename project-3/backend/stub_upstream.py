@@ -0,0 +1,82 @@
+"""Локальная заглушка OpenWeatherMap для проверки кэша и предохранителя.
+
+Запуск:
+    uvicorn stub_upstream:app --port 9000
+    OPENWEATHER_BASE_URL=http://127.0.0.1:9000 OPENWEATHER_API_KEY=test fastapi dev main.py
+
+Задержку и долю ошибок можно менять на лету:
+    curl -X POST "http://127.0.0.1:9000/_control?latency=5&failure_rate=0.5"
+"""
+import os
+import time
+import random
+import asyncio
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from typing import Optional
+
+app = FastAPI()
+
+# --- Параметры сбоев ---
+settings = {
+    "latency": float(os.getenv("STUB_LATENCY", "0")),            # задержка ответа в секундах
+    "failure_rate": float(os.getenv("STUB_FAILURE_RATE", "0")),  # доля ответов 500, от 0 до 1
+}
+stats = {"requests": 0, "failures": 0}
+
+
+async def simulate():
+    stats["requests"] += 1
+    if settings["latency"]:
+        await asyncio.sleep(settings["latency"])
+    if random.random() < settings["failure_rate"]:
+        stats["failures"] += 1
+        return JSONResponse(status_code=500, content={"message": "Injected failure"})
+    return None
+
+
+@app.post("/_control")
+async def control(latency: Optional[float] = None, failure_rate: Optional[float] = None):
+    if latency is not None:
+        settings["latency"] = latency
+    if failure_rate is not None:
+        settings["failure_rate"] = failure_rate
+    return {**settings, **stats}
+
+
+@app.get("/weather")
+async def weather(q: Optional[str] = None, lat: Optional[float] = None, lon: Optional[float] = None):
+    error = await simulate()
+    if error:
+        return error
+    if q and q.lower() == "nowhere":
+        return JSONResponse(status_code=404, content={"message": "city not found"})
+    # Как у настоящего сервиса: соседние координаты разрешаются в одно место с общим id
+    place = q.lower() if q else (round(lat, 1), round(lon, 1))
+    return {
+        "id": abs(hash(place)) % 10_000_000 + 1,
+        "name": q or f"Place {lat:.2f},{lon:.2f}",
+        "main": {"temp": round(random.uniform(-10, 30), 1)},
+        "weather": [{"description": "ясно", "icon": "01d"}],
+    }
+
+
+@app.get("/forecast")
+async def forecast(q: str):
+    error = await simulate()
+    if error:
+        return error
+    if q.lower() == "nowhere":
+        return JSONResponse(status_code=404, content={"message": "city not found"})
+    start = int(time.time()) // 10800 * 10800
+    slots = []
+    for i in range(40):  # 5 дней по 3 часа
+        dt = start + i * 10800
+        slots.append({
+            "dt": dt,
+            "dt_txt": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(dt)),
+            "main": {"temp": round(random.uniform(-10, 30), 1)},
+            "weather": [{"description": random.choice(["ясно", "дождь", "облачно"]), "icon": "01d"}],
+            "rain": {"3h": round(random.uniform(0, 2), 2)} if random.random() < 0.3 else {},
+        })
+    return {"city": {"name": q, "timezone": 0}, "list": slots}
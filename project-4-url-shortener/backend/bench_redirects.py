@@ -0,0 +1,91 @@
+"""Сравнение пропускной способности редиректов: FastAPI против быстрого ASGI-пути.
+
+Запуск из папки backend:
+    python bench_redirects.py --requests 20000 --codes 1000
+
+Приложение вызывается напрямую как ASGI, без сети, поэтому цифры показывают
+накладные расходы самого обработчика.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+# Отдельная база и приложение без быстрого пути - его подключаем вручную
+os.environ["SHORTENER_DB"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["SHORTENER_FAST_REDIRECTS"] = "0"
+
+from datetime import timedelta  # noqa: E402
+import main  # noqa: E402
+
+
+def make_scope(path: str) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("localhost", 8000),
+    }
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def run(asgi_app, codes, total: int, concurrency: int) -> float:
+    statuses = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    async def worker(offset: int):
+        for i in range(offset, total, concurrency):
+            await asgi_app(make_scope(f"/{codes[i % len(codes)]}"), receive, send)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    if any(status != 307 for status in statuses):
+        sys.exit(f"unexpected statuses: {set(statuses)}")
+    return total / elapsed
+
+
+async def main_async(args):
+    codes = [main.code_allocator.next_code() for _ in range(args.codes)]
+    for code in codes:
+        main.url_store.add(code, f"https://example.com/{code}", timedelta(days=1))
+
+    fastapi_app = main.app
+    fast_app = main.FastRedirectMiddleware(main.app)
+
+    # Прогрев: заполнить LRU и собрать стек middleware
+    await run(fastapi_app, codes, len(codes), args.concurrency)
+    await run(fast_app, codes, len(codes), args.concurrency)
+
+    baseline = await run(fastapi_app, codes, args.requests, args.concurrency)
+    fast = await run(fast_app, codes, args.requests, args.concurrency)
+
+    print(f"{'path':<22}{'req/s':>12}")
+    print(f"{'FastAPI route':<22}{baseline:>12,.0f}")
+    print(f"{'ASGI fast path':<22}{fast:>12,.0f}")
+    print(f"speedup: {fast / baseline:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--codes", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main_async(parser.parse_args()))
@@ -1,13 +1,33 @@
-import secrets
+import os
+import asyncio
+import hashlib
+import heapq
+import json
+import sqlite3
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, validator
-from urllib.parse import urlparse
-from typing import Optional
+from pydantic import BaseModel, Field, ValidationError, validator
+from urllib.parse import quote, urlparse
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Фоновый сброс накопленных кликов и удаление просроченных ссылок
+    flusher = asyncio.create_task(click_aggregator.run())
+    sweeper = asyncio.create_task(run_expiry_sweeper())
+    yield
+    sweeper.cancel()
+    flusher.cancel()
+    click_aggregator.flush()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # --- Настройка CORS ---
 origins = ["http://localhost:3000"]
@@ -19,17 +39,377 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- "База данных" в памяти ---
-# Пример: {"abc123": {"long_url": "...", "clicks": 0, "created_at": datetime}}
-url_db = {}
-
-# --- Срок действия ссылки в днях ---
+# --- Срок действия ссылки в днях (по умолчанию) ---
 EXPIRE_AFTER_DAYS = 7
+MAX_TTL_DAYS = 3650  # больший срок переполнял бы дату истечения
+
+# --- Хранилище ссылок: SQLite на диске + LRU горячих кодов в памяти ---
+DB_FILE = os.getenv("SHORTENER_DB", "urls.db")
+HOT_CACHE_SIZE = int(os.getenv("SHORTENER_HOT_CACHE_SIZE", "10000"))
+
+
+class URLStore:
+    """Ссылки лежат в SQLite, популярные коды - в LRU-кэше ограниченного размера.
+
+    Запись в кэше: {"long_url": "...", "clicks": 0, "created_at": datetime, "expires_at": datetime}
+    Сроки действия лежат в min-куче (expires_at, code), чтобы удалять просроченные без полного обхода.
+    """
+
+    def __init__(self, path: str, cache_size: int, default_ttl: timedelta):
+        # Эндпоинты синхронные и выполняются в пуле потоков, поэтому соединение общее под блокировкой
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS urls (
+                code TEXT PRIMARY KEY,
+                long_url TEXT NOT NULL,
+                clicks INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                expires_at TEXT
+            )"""
+        )
+        # Базы, созданные до появления индивидуального срока действия
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(urls)")]
+        if "expires_at" not in columns:
+            self.conn.execute("ALTER TABLE urls ADD COLUMN expires_at TEXT")
+        for code, created_at in self.conn.execute(
+            "SELECT code, created_at FROM urls WHERE expires_at IS NULL"
+        ).fetchall():
+            expires_at = datetime.fromisoformat(created_at) + default_ttl
+            self.conn.execute("UPDATE urls SET expires_at = ? WHERE code = ?", (expires_at.isoformat(), code))
+        # Почасовая гистограмма кликов; дневная получается суммированием часов
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS click_stats (
+                code TEXT NOT NULL,
+                hour TEXT NOT NULL,
+                clicks INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (code, hour)
+            )"""
+        )
+        # Общий для всех воркеров счётчик, из которого раздаются диапазоны кодов
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS code_counter (
+                name TEXT PRIMARY KEY,
+                next_value INTEGER NOT NULL
+            )"""
+        )
+        self.conn.execute("INSERT OR IGNORE INTO code_counter (name, next_value) VALUES ('urls', 0)")
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.cache: "OrderedDict[str, dict]" = OrderedDict()
+        self.cache_size = cache_size
+
+        # Куча строится один раз при старте, дальше поддерживается вставками и очисткой
+        self.expiry_heap: List[Tuple[datetime, str]] = [
+            (datetime.fromisoformat(expires_at), code)
+            for code, expires_at in self.conn.execute("SELECT code, expires_at FROM urls")
+        ]
+        heapq.heapify(self.expiry_heap)
+        self.evicted_total = 0
+        self.last_sweep_evicted = 0
+
+    def _remember(self, code: str, data: dict):
+        self.cache[code] = data
+        self.cache.move_to_end(code)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def get_hot(self, code: str) -> Optional[dict]:
+        """Только LRU, без блокировки и без диска - для быстрого пути в event loop.
+
+        Отдельные операции OrderedDict атомарны под GIL; код мог быть вытеснен между
+        get и move_to_end, тогда просто не обновляем его позицию.
+        """
+        data = self.cache.get(code)
+        if data is not None:
+            try:
+                self.cache.move_to_end(code)
+            except KeyError:
+                pass
+        return data
+
+    def get(self, code: str) -> Optional[dict]:
+        # Попадание в LRU обходится без блокировки, она нужна только для чтения с диска
+        data = self.get_hot(code)
+        if data is not None:
+            return data
+        with self.lock:
+            data = self.cache.get(code)
+            if data is not None:
+                self.cache.move_to_end(code)
+                return data
+
+            # Холодный код - один поиск по первичному ключу
+            row = self.conn.execute(
+                "SELECT long_url, clicks, created_at, expires_at FROM urls WHERE code = ?", (code,)
+            ).fetchone()
+            if row is None:
+                return None
+            data = {
+                "long_url": row[0],
+                "clicks": row[1],
+                "created_at": datetime.fromisoformat(row[2]),
+                "expires_at": datetime.fromisoformat(row[3]),
+            }
+            self._remember(code, data)
+            return data
+
+    def add(self, code: str, long_url: str, ttl: timedelta) -> Optional[dict]:
+        """Сохраняет ссылку. Возвращает None, если код уже занят."""
+        created_at = datetime.utcnow()
+        data = {"long_url": long_url, "clicks": 0, "created_at": created_at, "expires_at": created_at + ttl}
+        with self.lock:
+            try:
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT INTO urls (code, long_url, clicks, created_at, expires_at) VALUES (?, ?, 0, ?, ?)",
+                        (code, long_url, created_at.isoformat(), data["expires_at"].isoformat()),
+                    )
+            except sqlite3.IntegrityError:
+                return None
+            self._remember(code, data)
+            heapq.heappush(self.expiry_heap, (data["expires_at"], code))
+            return data
+
+    def add_many(self, items: List[Tuple[str, str, timedelta]]) -> List[Optional[dict]]:
+        """Сохраняет пачку ссылок одной транзакцией. None на месте занятых кодов."""
+        created_at = datetime.utcnow()
+        results: List[Optional[dict]] = []
+        with self.lock:
+            with self.conn:
+                for code, long_url, ttl in items:
+                    data = {"long_url": long_url, "clicks": 0, "created_at": created_at, "expires_at": created_at + ttl}
+                    inserted = self.conn.execute(
+                        """INSERT INTO urls (code, long_url, clicks, created_at, expires_at) VALUES (?, ?, 0, ?, ?)
+                        ON CONFLICT (code) DO NOTHING""",
+                        (code, long_url, created_at.isoformat(), data["expires_at"].isoformat()),
+                    ).rowcount
+                    results.append(data if inserted else None)
+            # Массовые ссылки не вытесняют горячие коды из LRU, но попадают в кучу сроков
+            for (code, _, _), data in zip(items, results):
+                if data is not None:
+                    heapq.heappush(self.expiry_heap, (data["expires_at"], code))
+        return results
+
+    def sweep_expired(self, now: datetime) -> int:
+        """Удаляет просроченные ссылки: O(log n) на каждую, без обхода всей таблицы."""
+        with self.lock:
+            expired = []
+            while self.expiry_heap and self.expiry_heap[0][0] <= now:
+                expired.append(heapq.heappop(self.expiry_heap)[1])
+            if not expired:
+                self.last_sweep_evicted = 0
+                return 0
+
+            with self.conn:
+                # Условие по expires_at защищает ссылки, созданные под тем же кодом другим воркером
+                deleted = self.conn.executemany(
+                    "DELETE FROM urls WHERE code = ? AND expires_at <= ?",
+                    [(code, now.isoformat()) for code in expired],
+                ).rowcount
+                self.conn.executemany(
+                    "DELETE FROM click_stats WHERE code = ? AND NOT EXISTS (SELECT 1 FROM urls WHERE code = ?)",
+                    [(code, code) for code in expired],
+                )
+            for code in expired:
+                data = self.cache.get(code)
+                if data is not None and data["expires_at"] <= now:
+                    del self.cache[code]
+
+            self.evicted_total += deleted
+            self.last_sweep_evicted = deleted
+            return deleted
+
+    def reserve_range(self, size: int) -> Tuple[int, int]:
+        """Атомарно забирает у общего счётчика диапазон [start, start + size)."""
+        with self.lock:
+            with self.conn:
+                row = self.conn.execute(
+                    "UPDATE code_counter SET next_value = next_value + ? WHERE name = 'urls' RETURNING next_value",
+                    (size,),
+                ).fetchone()
+        return row[0] - size, row[0]
+
+    def add_clicks(self, totals: Dict[str, int], hourly: Dict[Tuple[str, str], int]):
+        """Записывает пачку кликов одной транзакцией."""
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE urls SET clicks = clicks + ? WHERE code = ?",
+                    [(count, code) for code, count in totals.items()],
+                )
+                self.conn.executemany(
+                    """INSERT INTO click_stats (code, hour, clicks) VALUES (?, ?, ?)
+                    ON CONFLICT (code, hour) DO UPDATE SET clicks = clicks + excluded.clicks""",
+                    [(code, hour, count) for (code, hour), count in hourly.items()],
+                )
+            for code, count in totals.items():
+                data = self.cache.get(code)
+                if data is not None:
+                    data["clicks"] += count
+
+    def click_histogram(self, code: str) -> Dict[str, int]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT hour, clicks FROM click_stats WHERE code = ? ORDER BY hour", (code,)
+            ).fetchall()
+        return dict(rows)
+
+
+url_store = URLStore(DB_FILE, HOT_CACHE_SIZE, timedelta(days=EXPIRE_AFTER_DAYS))
+
+# --- Выдача коротких кодов без проверок на коллизии ---
+BASE62_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+CODE_BLOCK_SIZE = int(os.getenv("SHORTENER_CODE_BLOCK_SIZE", "1000"))
+# Если задан секрет, номера перемешиваются обратимой перестановкой, и коды нельзя угадать подряд.
+# Секрет нельзя менять после запуска: иначе новые коды пересекутся со старыми.
+CODE_SECRET = os.getenv("SHORTENER_CODE_SECRET")
+OBFUSCATED_CODE_LENGTH = 7
+
+
+def base62_encode(number: int, length: int = 0) -> str:
+    chars = []
+    while number:
+        number, rem = divmod(number, 62)
+        chars.append(BASE62_ALPHABET[rem])
+    return "".join(reversed(chars)).rjust(max(length, 1), BASE62_ALPHABET[0])
+
+
+class CodePermutation:
+    """Обратимая перестановка чисел [0, 62^length): сеть Фейстеля по 2^bits + cycle walking."""
+
+    ROUNDS = 4
+
+    def __init__(self, secret: str, length: int):
+        self.key = hashlib.sha256(secret.encode()).digest()
+        self.domain = 62 ** length
+        self.half_bits = (self.domain.bit_length() + 1) // 2
+        self.mask = (1 << self.half_bits) - 1
+
+    def _round(self, i: int, value: int) -> int:
+        digest = hashlib.blake2b(f"{i}:{value}".encode(), key=self.key, digest_size=8).digest()
+        return int.from_bytes(digest, "big") & self.mask
+
+    def _feistel(self, x: int, rounds) -> int:
+        left, right = x >> self.half_bits, x & self.mask
+        for i in rounds:
+            left, right = right, left ^ self._round(i, right)
+        return (right << self.half_bits) | left
+
+    def permute(self, x: int) -> int:
+        # Результат сети может выйти за пределы домена - тогда шифруем ещё раз
+        x = self._feistel(x, range(self.ROUNDS))
+        while x >= self.domain:
+            x = self._feistel(x, range(self.ROUNDS))
+        return x
+
+    def invert(self, y: int) -> int:
+        y = self._feistel(y, range(self.ROUNDS - 1, -1, -1))
+        while y >= self.domain:
+            y = self._feistel(y, range(self.ROUNDS - 1, -1, -1))
+        return y
+
+
+class CodeAllocator:
+    """Раздаёт коды из диапазонов счётчика, заранее зарезервированных этим воркером.
+
+    Каждый номер выдаётся ровно один раз, поэтому выдача стоит O(1) при любом заполнении таблицы.
+    """
+
+    def __init__(self, store: URLStore, block_size: int, secret: Optional[str]):
+        self.store = store
+        self.block_size = block_size
+        self.permutation = CodePermutation(secret, OBFUSCATED_CODE_LENGTH) if secret else None
+        self.lock = threading.Lock()
+        self.next_value = 0
+        self.end_value = 0
+
+    def next_code(self) -> str:
+        with self.lock:
+            if self.next_value >= self.end_value:
+                self.next_value, self.end_value = self.store.reserve_range(self.block_size)
+            value = self.next_value
+            self.next_value += 1
+
+        if self.permutation:
+            return base62_encode(self.permutation.permute(value), OBFUSCATED_CODE_LENGTH)
+        return base62_encode(value)
+
+
+code_allocator = CodeAllocator(url_store, CODE_BLOCK_SIZE, CODE_SECRET)
+
+# --- Фоновая очистка просроченных ссылок ---
+SWEEP_INTERVAL = float(os.getenv("SHORTENER_SWEEP_INTERVAL", "60"))  # в секундах
+
+
+async def run_expiry_sweeper():
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            await asyncio.to_thread(url_store.sweep_expired, datetime.utcnow())
+        except Exception as e:
+            print(f"Expiry sweep failed: {e}")
+
+# --- Агрегация кликов вне пути редиректа ---
+CLICK_FLUSH_INTERVAL_MS = int(os.getenv("SHORTENER_CLICK_FLUSH_MS", "1000"))
+
+
+class ClickAggregator:
+    """Копит клики в памяти воркера и раз в CLICK_FLUSH_INTERVAL_MS сбрасывает их пачкой."""
+
+    def __init__(self, store: URLStore, interval_ms: int):
+        self.store = store
+        self.interval = interval_ms / 1000
+        self.lock = threading.Lock()
+        self.totals: Dict[str, int] = defaultdict(int)
+        self.hourly: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    def record(self, code: str):
+        hour = datetime.utcnow().strftime("%Y-%m-%dT%H")
+        with self.lock:
+            self.totals[code] += 1
+            self.hourly[(code, hour)] += 1
+
+    def pending(self, code: str) -> Tuple[int, Dict[str, int]]:
+        """Клики, ещё не попавшие в хранилище: (всего, по часам)."""
+        with self.lock:
+            hourly = {hour: count for (c, hour), count in self.hourly.items() if c == code}
+            return self.totals.get(code, 0), hourly
+
+    def flush(self):
+        with self.lock:
+            if not self.totals:
+                return
+            totals, hourly = self.totals, self.hourly
+            self.totals, self.hourly = defaultdict(int), defaultdict(int)
+        try:
+            self.store.add_clicks(totals, hourly)
+        except Exception:
+            # Транзакция откатилась - возвращаем пачку, чтобы клики ушли со следующим сбросом
+            with self.lock:
+                for code, count in totals.items():
+                    self.totals[code] += count
+                for key, count in hourly.items():
+                    self.hourly[key] += count
+            raise
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"Click flush failed: {e}")
+
+
+click_aggregator = ClickAggregator(url_store, CLICK_FLUSH_INTERVAL_MS)
 
 # --- Модель запроса ---
 class URLCreate(BaseModel):
     long_url: str
     custom_code: Optional[str] = None
+    ttl_days: Optional[float] = Field(None, le=MAX_TTL_DAYS)  # по умолчанию EXPIRE_AFTER_DAYS
 
     @validator('long_url')
     def validate_url(cls, v):
@@ -38,43 +418,216 @@ class URLCreate(BaseModel):
             raise ValueError("Недопустимый URL")
         return v
 
+    @validator('ttl_days')
+    def validate_ttl(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("Срок действия должен быть положительным")
+        return v
+
 # --- Эндпоинт создания короткой ссылки ---
 @app.post("/api/shorten")
 def create_short_url(url_data: URLCreate, request: Request):
     long_url = str(url_data.long_url)
+    ttl = timedelta(days=url_data.ttl_days or EXPIRE_AFTER_DAYS)
 
     if url_data.custom_code:
         short_code = url_data.custom_code
-        if short_code in url_db:
+        data = url_store.add(short_code, long_url, ttl)
+        if data is None:
             raise HTTPException(status_code=400, detail="Этот код уже занят.")
     else:
-        short_code = secrets.token_urlsafe(4)
-        while short_code in url_db:
-            short_code = secrets.token_urlsafe(4)
-
-    url_db[short_code] = {
-        "long_url": long_url,
-        "clicks": 0,
-        "created_at": datetime.utcnow()
-    }
+        # Выданный код уникален; повтор нужен только если его уже занял пользовательский код
+        data = None
+        while data is None:
+            short_code = code_allocator.next_code()
+            data = url_store.add(short_code, long_url, ttl)
 
     base_url = str(request.base_url)
     short_url = f"{base_url}{short_code}"
 
-    return {"short_url": short_url, "clicks": 0}
+    return {"short_url": short_url, "clicks": 0, "expires_at": data["expires_at"]}
+
+# --- Массовое создание коротких ссылок ---
+BULK_MAX_ITEMS = int(os.getenv("SHORTENER_BULK_MAX_ITEMS", "100000"))
+BULK_CHUNK_SIZE = 1000  # столько ссылок вставляется одной транзакцией
+
+
+async def read_ndjson_lines(request: Request) -> List[bytes]:
+    """Строки NDJSON, разобранные по мере поступления тела.
+
+    Тело дочитывается до начала ответа: StreamingResponse сам слушает receive(),
+    и параллельное чтение запроса из генератора ответа зависло бы.
+    """
+    lines: List[bytes] = []
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        lines.extend(line for line in complete if line.strip())
+    if buffer.strip():
+        lines.append(buffer)
+    return lines
+
+
+def parse_bulk_item(raw: object) -> URLCreate:
+    if isinstance(raw, bytes):
+        raw = json.loads(raw)
+    if isinstance(raw, str):
+        raw = {"long_url": raw}
+    if not isinstance(raw, dict):
+        raise ValueError("Ожидался объект или строка с URL")
+    return URLCreate(**raw)
+
+
+def shorten_chunk(chunk: List[Tuple[int, object]], base_url: str) -> List[dict]:
+    """Проверяет, выдаёт коды и сохраняет пачку ссылок. Ошибка элемента не прерывает пачку."""
+    results: Dict[int, dict] = {}
+    pending: List[Tuple[int, str, str, timedelta, bool]] = []
+
+    for index, raw in chunk:
+        try:
+            url_data = parse_bulk_item(raw)
+            # Срок проверяется здесь же: переполнение даты в add_many оборвало бы всю пачку
+            ttl = timedelta(days=url_data.ttl_days or EXPIRE_AFTER_DAYS)
+            if ttl > datetime.max - datetime.utcnow():
+                raise OverflowError
+        except ValidationError as e:
+            results[index] = {"index": index, "error": e.errors()[0]["msg"]}
+            continue
+        except ValueError as e:
+            results[index] = {"index": index, "error": str(e)}
+            continue
+        except OverflowError:
+            results[index] = {"index": index, "error": "Слишком большой срок действия"}
+            continue
+        code = url_data.custom_code or code_allocator.next_code()
+        pending.append((index, code, url_data.long_url, ttl, bool(url_data.custom_code)))
+
+    stored = url_store.add_many([(code, long_url, ttl) for _, code, long_url, ttl, _ in pending])
+
+    for (index, code, long_url, ttl, is_custom), data in zip(pending, stored):
+        if data is None and not is_custom:
+            # Выданный код совпал с пользовательским - берём следующий
+            while data is None:
+                code = code_allocator.next_code()
+                data = url_store.add(code, long_url, ttl)
+        if data is None:
+            results[index] = {"index": index, "error": "Этот код уже занят."}
+        else:
+            results[index] = {"index": index, "short_url": f"{base_url}{code}", "expires_at": data["expires_at"].isoformat()}
+
+    return [results[index] for index, _ in chunk]
+
+
+@app.post("/api/shorten/bulk")
+async def create_short_urls_bulk(request: Request):
+    base_url = str(request.base_url)
+    content_type = request.headers.get("content-type", "")
+
+    if "ndjson" in content_type or "jsonl" in content_type:
+        items = await read_ndjson_lines(request)
+    else:
+        try:
+            body = json.loads(await request.body())
+        except ValueError:
+            body = None
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Ожидался JSON-массив или NDJSON")
+        items = body
+
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Слишком много ссылок, максимум {BULK_MAX_ITEMS}")
+
+    async def generate():
+        for start in range(0, len(items), BULK_CHUNK_SIZE):
+            chunk = list(enumerate(items[start:start + BULK_CHUNK_SIZE], start))
+            for result in await asyncio.to_thread(shorten_chunk, chunk, base_url):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    # Ответ - NDJSON в порядке входных элементов, строки отдаются по мере готовности пачек
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+# --- Эндпоинт статистики очистки ---
+@app.get("/api/expiry-stats")
+def get_expiry_stats():
+    return {
+        "evicted_total": url_store.evicted_total,
+        "last_sweep_evicted": url_store.last_sweep_evicted,
+        "tracked_links": len(url_store.expiry_heap),
+        "next_expiry": url_store.expiry_heap[0][0] if url_store.expiry_heap else None,
+    }
+
+# --- Эндпоинт статистики кликов ---
+@app.get("/api/stats/{short_code}")
+def get_click_stats(short_code: str):
+    data = url_store.get(short_code)
+    if not data:
+        raise HTTPException(status_code=404, detail="Ссылка не найдена")
+
+    pending_total, pending_hourly = click_aggregator.pending(short_code)
+    hourly = url_store.click_histogram(short_code)
+    for hour, count in pending_hourly.items():
+        hourly[hour] = hourly.get(hour, 0) + count
+
+    daily: Dict[str, int] = defaultdict(int)
+    for hour, count in sorted(hourly.items()):
+        daily[hour[:10]] += count
+
+    return {
+        "short_code": short_code,
+        "long_url": data["long_url"],
+        "clicks": data["clicks"] + pending_total,
+        "daily": dict(daily),
+        "hourly": dict(sorted(hourly.items())),
+    }
 
 # --- Эндпоинт редиректа по короткой ссылке ---
 @app.get("/{short_code}")
 def redirect_to_long_url(short_code: str):
-    data = url_db.get(short_code)
+    data = url_store.get(short_code)
 
     if not data:
         raise HTTPException(status_code=404, detail="Ссылка не найдена")
 
-    created_at = data["created_at"]
-    if datetime.utcnow() > created_at + timedelta(days=EXPIRE_AFTER_DAYS):
+    # Ссылка могла истечь до очередного прохода очистки
+    if datetime.utcnow() > data["expires_at"]:
         raise HTTPException(status_code=404, detail="Срок действия ссылки истёк.")
 
-    data["clicks"] += 1
+    click_aggregator.record(short_code)
+
+    return RedirectResponse(url=data["long_url"])
+
+
+# --- Быстрый путь для редиректов в обход FastAPI ---
+FAST_REDIRECTS = os.getenv("SHORTENER_FAST_REDIRECTS", "1") == "1"
+# Пути, которые всегда обслуживает FastAPI
+RESERVED_PATHS = {"docs", "redoc", "openapi.json", "favicon.ico"}
+
+
+class FastRedirectMiddleware:
+    """Чистое ASGI: горячие коды из LRU получают 307 с заранее собранными заголовками,
+    без роутинга, зависимостей и перехода в пул потоков. Всё остальное уходит в FastAPI."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET":
+            code = scope["path"][1:]
+            if code and "/" not in code and code not in RESERVED_PATHS:
+                data = url_store.get_hot(code)
+                if data is not None and datetime.utcnow() <= data["expires_at"]:
+                    headers = data.get("redirect_headers")
+                    if headers is None:
+                        location = quote(data["long_url"], safe=":/%#?=@[]!$&'()*+,;").encode("latin-1")
+                        headers = data["redirect_headers"] = [(b"location", location), (b"content-length", b"0")]
+                    click_aggregator.record(code)
+                    await send({"type": "http.response.start", "status": 307, "headers": headers})
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+
+        await self.app(scope, receive, send)
+
 
-    return RedirectResponse(url=data["long_url"])
\ No newline at end of file
+if FAST_REDIRECTS:
+    app.add_middleware(FastRedirectMiddleware)
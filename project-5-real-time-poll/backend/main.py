@@ -1,11 +1,32 @@
 import os
+import glob
 import json
-from fastapi import FastAPI, HTTPException
+import math
+import base64
+import hashlib
+import time
+import asyncio
+import bisect
+import itertools
+import threading
+from contextlib import asynccontextmanager, ExitStack
+from datetime import datetime, timezone
+from fastapi import FastAPI, Header, HTTPException, Query, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, List
+from pydantic import BaseModel, Field
+from typing import Annotated, Callable, Dict, List, Literal, Optional, Set, Tuple
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Снимок пишется в фоне: по таймеру или после SNAPSHOT_EVERY_VOTES голосов
+    snapshotter = asyncio.create_task(run_snapshotter())
+    yield
+    snapshotter.cancel()
+    storage.snapshot(capture_state)
+
+
+app = FastAPI(lifespan=lifespan)
 
 # --- CORS настройки ---
 origins = ["http://localhost:3000"]
@@ -18,7 +39,15 @@ app.add_middleware(
 )
 
 # --- Путь к файлу для сохранения опросов ---
-DATA_FILE = "polls.json"
+DATA_FILE = "polls.json"  # снимок всех опросов
+SNAPSHOT_INTERVAL = float(os.getenv("POLL_SNAPSHOT_INTERVAL", "5"))  # в секундах
+SNAPSHOT_EVERY_VOTES = int(os.getenv("POLL_SNAPSHOT_EVERY_VOTES", "1000"))
+# Не чаще стольких обновлений в секунду на подписчика, сколько бы ни было голосов
+BROADCAST_RATE = float(os.getenv("POLL_BROADCAST_RATE", "10"))
+# Сортировка списка опросов по голосам пересчитывается не чаще раза в столько секунд
+SUMMARY_CACHE_TTL = float(os.getenv("POLL_SUMMARY_CACHE_TTL", "1"))
+# Число полос счётчиков: потоки пула голосуют в разные полосы и не ждут друг друга
+COUNTER_STRIPES = int(os.getenv("POLL_COUNTER_STRIPES", "16"))
 
 # --- Изначальный дефолтный опрос ---
 poll_data = {
@@ -31,15 +60,403 @@ poll_data = {
     }
 }
 
+
+# --- Полосатые счётчики голосов ---
+_stripe_ids = itertools.count()
+_thread_stripe = threading.local()
+
+
+def current_stripe() -> int:
+    """Каждый поток пула получает свою полосу по кругу при первом голосе."""
+    stripe = getattr(_thread_stripe, "value", None)
+    if stripe is None:
+        stripe = _thread_stripe.value = next(_stripe_ids) % COUNTER_STRIPES
+    return stripe
+
+
+class VoteCounter:
+    """Счётчики вариантов опроса, разбитые на COUNTER_STRIPES полос.
+
+    Поток меняет только ячейки своей полосы и только под её блокировкой,
+    чтение складывает полосы. Каждая ячейка читается атомарно, поэтому голоса не теряются.
+    """
+
+    def __init__(self, initial: Dict[str, int]):
+        self.index = {key: i for i, key in enumerate(initial)}
+        # Последняя колонка - общее число голосов, чтобы список опросов не складывал варианты
+        self.cells = [[0] * (len(initial) + 1) for _ in range(COUNTER_STRIPES)]
+        self.cells[0] = list(initial.values()) + [sum(initial.values())]
+
+    def add(self, option_key: str, stripe: int):
+        # Вызывается под блокировкой полосы stripe
+        row = self.cells[stripe]
+        row[self.index[option_key]] += 1
+        row[-1] += 1
+
+    def totals(self) -> Dict[str, int]:
+        sums = [sum(column) for column in zip(*self.cells)]
+        return {key: sums[i] for key, i in self.index.items()}
+
+    def total(self) -> int:
+        return sum(row[-1] for row in self.cells)
+
+
+# --- Один голос на участника ---
+def voter_digest(token: str) -> bytes:
+    # Храним 16-байтовый хэш вместо строки токена
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+class BloomFilter:
+    """Фиксированный битовый массив под ожидаемое число участников и долю ложных срабатываний.
+
+    Ложное срабатывание означает, что новому участнику откажут как уже проголосовавшему.
+    """
+
+    def __init__(self, size_bits: int, num_hashes: int, bits: Optional[bytearray] = None):
+        self.size_bits = size_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((size_bits + 7) // 8)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_capacity(cls, capacity: int, false_positive_rate: float) -> "BloomFilter":
+        size_bits = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        num_hashes = max(1, round(size_bits / capacity * math.log(2)))
+        return cls(size_bits, num_hashes)
+
+    def _positions(self, digest: bytes):
+        # Двойное хэширование: k позиций из двух половин одного хэша
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size_bits for i in range(self.num_hashes)]
+
+    def add(self, digest: bytes) -> bool:
+        """Добавляет участника. False, если он (вероятно) уже голосовал."""
+        positions = self._positions(digest)
+        with self.lock:
+            if all(self.bits[p >> 3] & (1 << (p & 7)) for p in positions):
+                return False
+            for p in positions:
+                self.bits[p >> 3] |= 1 << (p & 7)
+            return True
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": "bloom",
+            "size_bits": self.size_bits,
+            "num_hashes": self.num_hashes,
+            "bits": base64.b64encode(bytes(self.bits)).decode(),
+        }
+
+
+class ExactVoterSet:
+    """Точный режим: множество 16-байтовых хэшей токенов."""
+
+    def __init__(self, digests: Optional[Set[bytes]] = None):
+        self.digests = digests if digests is not None else set()
+        self.lock = threading.Lock()
+
+    def add(self, digest: bytes) -> bool:
+        with self.lock:
+            if digest in self.digests:
+                return False
+            self.digests.add(digest)
+            return True
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            packed = b"".join(self.digests)
+        return {"kind": "exact", "voters": base64.b64encode(packed).decode()}
+
+
+def voter_filter_from_dict(data: dict):
+    if data["kind"] == "bloom":
+        return BloomFilter(data["size_bits"], data["num_hashes"], bytearray(base64.b64decode(data["bits"])))
+    packed = base64.b64decode(data["voters"])
+    return ExactVoterSet({packed[i:i + 16] for i in range(0, len(packed), 16)})
+
+
+# --- Хранилище: снимок + журнал изменений ---
+class PollStorage:
+    """Голоса и новые опросы дописываются в журнал votes.<поколение>.log за O(1),
+    а снимок polls.json периодически переписывается атомарно (временный файл + rename).
+
+    Снимок помнит поколение журнала, с которого начинаются не вошедшие в него записи,
+    поэтому сбой в любой момент не теряет и не удваивает голоса.
+
+    Запись в журнал идёт под блокировкой полосы голосующего потока; снимок берёт
+    все блокировки сразу (exclusive), поэтому видит согласованное состояние.
+    """
+
+    def __init__(self, snapshot_path: str):
+        self.snapshot_path = snapshot_path
+        self.log_dir = os.path.dirname(os.path.abspath(snapshot_path))
+        self.stripe_locks = [threading.Lock() for _ in range(COUNTER_STRIPES)]
+        self.generation = 0
+        self.log = None
+        self.pending_records = 0
+        self.last_snapshot = time.monotonic()
+
+    def exclusive(self) -> ExitStack:
+        stack = ExitStack()
+        for lock in self.stripe_locks:
+            stack.enter_context(lock)
+        return stack
+
+    def log_path(self, generation: int) -> str:
+        return os.path.join(self.log_dir, f"votes.{generation}.log")
+
+    def log_generations(self) -> List[int]:
+        generations = []
+        for path in glob.glob(os.path.join(self.log_dir, "votes.*.log")):
+            try:
+                generations.append(int(os.path.basename(path).split(".")[1]))
+            except ValueError:
+                pass
+        return sorted(generations)
+
+    def load(self) -> dict:
+        """Читает снимок и проигрывает поверх него журналы.
+
+        Возвращает {"polls": {...}, "next_poll_number": n}.
+        """
+        loaded = {"polls": {"default": poll_data}, "next_poll_number": 1}
+        generation = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if "polls" in snapshot and "log_generation" in snapshot:
+                generation = snapshot.pop("log_generation")
+                loaded = {**loaded, **snapshot}
+            else:
+                # Старый формат: просто словарь опросов
+                loaded["polls"] = snapshot
+
+        for log_generation in self.log_generations():
+            if log_generation >= generation:
+                self.replay(self.log_path(log_generation), loaded["polls"])
+
+        self.generation = max([generation] + self.log_generations())
+        return loaded
+
+    def replay(self, path: str, target: Dict[str, dict]):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # запись оборвалась при сбое
+                kind, _, payload = line.rstrip("\n").partition(" ")
+                if kind == "V":
+                    poll_id, option_key, *voter = payload.split(" ")
+                    poll = target.get(poll_id, {})
+                    option = poll.get("options", {}).get(option_key)
+                    if option is not None:
+                        option["votes"] += 1
+                        if voter:
+                            poll.setdefault("replayed_voters", []).append(bytes.fromhex(voter[0]))
+                elif kind == "C":
+                    record = json.loads(payload)
+                    target[record["id"]] = record["poll"]
+
+    def _append(self, line: str):
+        # Журнал открыт в двоичном режиме: BufferedWriter пишет строку целиком под своей
+        # блокировкой, а TextIOWrapper такого не обещает, и строки разных полос рвались бы.
+        # Счётчик записей приблизительный, он нужен только чтобы решить, пора ли делать снимок
+        self.log.write(line.encode("utf-8"))
+        self.log.flush()
+        self.pending_records += 1
+
+    def append_vote(self, poll_id: str, option_key: str, voter: Optional[bytes] = None):
+        if voter is None:
+            self._append(f"V {poll_id} {option_key}\n")
+        else:
+            self._append(f"V {poll_id} {option_key} {voter.hex()}\n")
+
+    def append_poll(self, poll_id: str, poll: dict):
+        record = json.dumps({"id": poll_id, "poll": poll}, ensure_ascii=False, separators=(",", ":"))
+        self._append(f"C {record}\n")
+
+    def snapshot_due(self) -> bool:
+        if not self.pending_records:
+            return False
+        return (self.pending_records >= SNAPSHOT_EVERY_VOTES
+                or time.monotonic() - self.last_snapshot >= SNAPSHOT_INTERVAL)
+
+    def snapshot(self, capture: Callable[[], dict]):
+        # Под блокировками только переключаемся на новый журнал и фиксируем состояние
+        with self.exclusive():
+            old_generation = self.generation
+            self.generation += 1
+            if self.log:
+                self.log.close()
+            self.log = open(self.log_path(self.generation), "ab")
+            state = capture()
+            self.pending_records = 0
+            self.last_snapshot = time.monotonic()
+
+        content = json.dumps(
+            {"log_generation": self.generation, **state},
+            ensure_ascii=False, separators=(",", ":"),
+        )
+
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        # Всё, что было в старых журналах, теперь в снимке
+        for generation in self.log_generations():
+            if generation <= old_generation:
+                os.remove(self.log_path(generation))
+
+
 # --- Словарь для хранения всех опросов (id -> poll) ---
+# В polls только вопрос и подписи вариантов, голоса - в counters
+storage = PollStorage(DATA_FILE)
 polls: Dict[str, dict] = {}
+counters: Dict[str, VoteCounter] = {}
+# Фильтры участников для опросов с ограничением "один голос на участника"
+voter_filters: Dict[str, object] = {}
+
+# --- Индекс опросов для списка ---
+# Номер опроса только растёт, поэтому id не повторяются даже после удалений
+next_poll_number = 1
+# (номер, id) в порядке создания и краткие сводки без данных вариантов
+poll_index: List[Tuple[int, str]] = []
+summaries: Dict[str, dict] = {}
+# Кэш порядка "по голосам": (время построения, [(-голоса, -номер, id), ...])
+votes_order_cache: Tuple[float, List[Tuple[int, int, str]]] = (0.0, [])
+
+
+def legacy_poll_number(poll_id: str) -> int:
+    # Опросы из старых снимков без номера: берём число из id вида "poll7"
+    digits = poll_id[4:] if poll_id.startswith("poll") else ""
+    return int(digits) if digits.isdigit() else 0
+
+
+def add_poll(poll_id: str, poll: dict):
+    global next_poll_number
+    # Счётчик появляется раньше опроса, чтобы параллельный голос не застал опрос без него
+    counters[poll_id] = VoteCounter({key: option["votes"] for key, option in poll["options"].items()})
+    if poll.get("voters"):
+        voter_filter = voter_filter_from_dict(poll["voters"])
+        for digest in poll.get("replayed_voters", []):
+            voter_filter.add(digest)
+        voter_filters[poll_id] = voter_filter
+    number = poll.get("number", legacy_poll_number(poll_id))
+    polls[poll_id] = {
+        "question": poll["question"],
+        "options": {key: {"label": option["label"]} for key, option in poll["options"].items()},
+        "number": number,
+        "created_at": poll.get("created_at"),
+    }
+
+    summaries[poll_id] = {"id": poll_id, "question": poll["question"], "created_at": poll.get("created_at")}
+    # Новые опросы идут в конец индекса, вставка в середину - только при загрузке старых данных
+    bisect.insort(poll_index, (number, poll_id))
+    next_poll_number = max(next_poll_number, number + 1)
+
+
+def poll_view(poll_id: str) -> dict:
+    """Опрос в формате PollResponse: подписи + сумма голосов по полосам."""
+    poll = polls[poll_id]
+    totals = counters[poll_id].totals()
+    return {
+        "question": poll["question"],
+        "options": {
+            key: {"label": option["label"], "votes": totals[key]}
+            for key, option in poll["options"].items()
+        },
+    }
+
+
+def capture_state() -> Dict[str, dict]:
+    # Вызывается под всеми блокировками полос. Фильтр участников сохраняется вместе с опросом
+    state = {}
+    for poll_id, poll in polls.items():
+        state[poll_id] = poll_view(poll_id)
+        state[poll_id]["number"] = poll["number"]
+        state[poll_id]["created_at"] = poll["created_at"]
+        if poll_id in voter_filters:
+            state[poll_id]["voters"] = voter_filters[poll_id].to_dict()
+    return {"polls": state, "next_poll_number": next_poll_number}
+
+
+# --- Загрузка опросов при старте: снимок + журнал, затем свежий снимок ---
+_loaded = storage.load()
+next_poll_number = _loaded["next_poll_number"]
+for _poll_id, _poll in _loaded["polls"].items():
+    add_poll(_poll_id, _poll)
+storage.snapshot(capture_state)
+
+
+async def run_snapshotter():
+    while True:
+        await asyncio.sleep(min(SNAPSHOT_INTERVAL, 0.5))
+        if storage.snapshot_due():
+            try:
+                await asyncio.to_thread(storage.snapshot, capture_state)
+            except Exception as e:
+                print(f"Snapshot failed: {e}")
+
+
+# --- Рассылка результатов подписчикам ---
+class Subscriber:
+    """Изменения, ещё не отправленные клиенту. Медленный клиент получит их одним сообщением."""
+
+    def __init__(self):
+        self.pending: Dict[str, int] = {}
+        self.ready = asyncio.Event()
+
+    def push(self, delta: Dict[str, int]):
+        self.pending.update(delta)
+        self.ready.set()
+
+    async def next_delta(self) -> Dict[str, int]:
+        await self.ready.wait()
+        self.ready.clear()
+        delta, self.pending = self.pending, {}
+        return delta
+
+
+class PollBroadcaster:
+    """Раз в 1/BROADCAST_RATE секунды сравнивает счётчики опроса с отправленными
+    и рассылает только изменившиеся варианты. Голосующие потоки в рассылке не участвуют."""
+
+    def __init__(self, poll_id: str):
+        self.poll_id = poll_id
+        self.subscribers: Set[Subscriber] = set()
+        self.last_sent = counters[poll_id].totals()
+        self.task: Optional[asyncio.Task] = None
+
+    def subscribe(self, subscriber: Subscriber):
+        self.subscribers.add(subscriber)
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def run(self):
+        try:
+            while self.subscribers:
+                await asyncio.sleep(1 / BROADCAST_RATE)
+                totals = counters[self.poll_id].totals()
+                delta = {key: votes for key, votes in totals.items() if self.last_sent.get(key) != votes}
+                if delta:
+                    self.last_sent = totals
+                    for subscriber in self.subscribers:
+                        subscriber.push(delta)
+        finally:
+            self.task = None
+            if not self.subscribers and broadcasters.get(self.poll_id) is self:
+                del broadcasters[self.poll_id]
+
+
+broadcasters: Dict[str, PollBroadcaster] = {}
 
-# --- Загрузка опросов при старте ---
-if os.path.exists(DATA_FILE):
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        polls = json.load(f)
-else:
-    polls = {"default": poll_data}
 
 # --- Pydantic модели ---
 class PollResponse(BaseModel):
@@ -49,11 +466,11 @@ class PollResponse(BaseModel):
 class CreatePollRequest(BaseModel):
     question: str
     options: List[str]
-
-# --- Сохранение в файл ---
-def save_polls():
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(polls, f, ensure_ascii=False, indent=2)
+    # Один голос на участника (заголовок X-Voter-Token): точно или через фильтр Блума
+    voter_dedup: Optional[Literal["exact", "bloom"]] = None
+    # Границы держат фильтр в пределах ~3.6 МБ: он пересохраняется с каждым снимком
+    expected_voters: int = Field(100_000, gt=0, le=1_000_000)
+    false_positive_rate: float = Field(0.001, ge=1e-6, lt=1)
 
 # --- Получение конкретного опроса ---
 def get_poll_or_404(poll_id: str):
@@ -66,21 +483,32 @@ def get_poll_or_404(poll_id: str):
 
 @app.get("/api/poll/{poll_id}", response_model=PollResponse)
 def get_poll(poll_id: str):
-    return get_poll_or_404(poll_id)
+    get_poll_or_404(poll_id)
+    return poll_view(poll_id)
 
 @app.post("/api/poll/vote/{poll_id}/{option_key}", response_model=PollResponse)
-def vote(poll_id: str, option_key: str):
+def vote(poll_id: str, option_key: str, x_voter_token: Annotated[Optional[str], Header()] = None):
     poll = get_poll_or_404(poll_id)
     if option_key not in poll["options"]:
         raise HTTPException(status_code=404, detail="Option not found")
-    poll["options"][option_key]["votes"] += 1
-    save_polls()
-    return poll
+
+    voter = None
+    voter_filter = voter_filters.get(poll_id)
+    if voter_filter is not None:
+        if not x_voter_token:
+            raise HTTPException(status_code=400, detail="X-Voter-Token header is required")
+        voter = voter_digest(x_voter_token)
+        if not voter_filter.add(voter):
+            raise HTTPException(status_code=409, detail="Already voted")
+
+    stripe = current_stripe()
+    with storage.stripe_locks[stripe]:
+        counters[poll_id].add(option_key, stripe)
+        storage.append_vote(poll_id, option_key, voter)
+    return poll_view(poll_id)
 
 @app.post("/api/poll/create")
 def create_poll(request: CreatePollRequest):
-    # Генерируем уникальный ID для нового опроса
-    poll_id = f"poll{len(polls) + 1}"
     options_dict = {}
 
     for idx, option_text in enumerate(request.options):
@@ -91,13 +519,99 @@ def create_poll(request: CreatePollRequest):
         "question": request.question,
         "options": options_dict
     }
+    if request.voter_dedup == "bloom":
+        new_poll["voters"] = BloomFilter.for_capacity(request.expected_voters, request.false_positive_rate).to_dict()
+    elif request.voter_dedup == "exact":
+        new_poll["voters"] = ExactVoterSet().to_dict()
+
+    new_poll["created_at"] = datetime.now(timezone.utc).isoformat()
 
-    polls[poll_id] = new_poll
-    save_polls()
+    with storage.exclusive():
+        # Генерируем уникальный ID для нового опроса из монотонного счётчика
+        new_poll["number"] = next_poll_number
+        poll_id = f"poll{next_poll_number}"
+        add_poll(poll_id, new_poll)
+        storage.append_poll(poll_id, new_poll)
 
     return {"poll_id": poll_id, "message": "Опрос успешно создан"}
 
+def votes_order() -> List[Tuple[int, int, str]]:
+    """Опросы по убыванию голосов (при равенстве - новые выше), пересобирается раз в SUMMARY_CACHE_TTL."""
+    global votes_order_cache
+    built_at, order = votes_order_cache
+    if time.monotonic() - built_at >= SUMMARY_CACHE_TTL:
+        order = sorted((-counters[poll_id].total(), -number, poll_id) for number, poll_id in poll_index)
+        votes_order_cache = (time.monotonic(), order)
+    return order
+
 @app.get("/api/polls")
-def get_all_polls():
-    """Вернуть список всех опросов (id + вопрос)."""
-    return [{"id": poll_id, "question": poll["question"]} for poll_id, poll in polls.items()]
\ No newline at end of file
+def get_all_polls(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    sort: Literal["created", "votes"] = "created",
+):
+    """Страница сводок опросов (id, вопрос, голоса, дата создания) с курсором на следующую."""
+    try:
+        if sort == "created":
+            # Курсор - номер последнего опроса на странице
+            start = bisect.bisect_right(poll_index, (int(cursor), "\uffff")) if cursor else 0
+            page = [poll_id for _, poll_id in poll_index[start:start + limit]]
+            has_more = start + limit < len(poll_index)
+        else:
+            # Курсор - "голоса:номер" последнего опроса на странице
+            order = votes_order()
+            if cursor:
+                votes, number = (int(part) for part in cursor.split(":"))
+                start = bisect.bisect_right(order, (-votes, -number, "\uffff"))
+            else:
+                start = 0
+            keys = order[start:start + limit]
+            page = [poll_id for _, _, poll_id in keys]
+            has_more = start + limit < len(order)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    items = [{**summaries[poll_id], "total_votes": counters[poll_id].total()} for poll_id in page]
+
+    next_cursor = None
+    if has_more:
+        if sort == "created":
+            next_cursor = str(polls[page[-1]]["number"])
+        else:
+            # Берём голоса из того же закэшированного порядка, чтобы курсор совпал с ним
+            neg_votes, neg_number, _ = keys[-1]
+            next_cursor = f"{-neg_votes}:{-neg_number}"
+
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.websocket("/ws/poll/{poll_id}")
+async def poll_updates(websocket: WebSocket, poll_id: str):
+    """Подписка на результаты: сначала полный опрос, затем только изменившиеся варианты."""
+    if poll_id not in polls:
+        await websocket.close(code=1008, reason="Poll not found")
+        return
+    await websocket.accept()
+
+    subscriber = Subscriber()
+    broadcaster = broadcasters.get(poll_id)
+    if broadcaster is None:
+        broadcaster = broadcasters[poll_id] = PollBroadcaster(poll_id)
+    broadcaster.subscribe(subscriber)
+
+    async def send_updates():
+        await websocket.send_json({"type": "snapshot", "poll_id": poll_id, **poll_view(poll_id)})
+        while True:
+            delta = await subscriber.next_delta()
+            await websocket.send_json({"type": "delta", "poll_id": poll_id, "votes": delta})
+
+    async def wait_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(send_updates()), asyncio.create_task(wait_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        broadcaster.unsubscribe(subscriber)
@@ -0,0 +1,95 @@
+"""Нагрузочная проверка счётчиков: ни один голос не должен потеряться.
+
+Запуск из папки backend:
+    python stress_votes.py --votes 20000 --concurrency 200
+
+Голоса идут через само приложение (синхронный эндпоинт в пуле потоков),
+параллельно с ними снимаются снимки. В конце сверяются счётчики в памяти
+и состояние, восстановленное из снимка и журнала в отдельном процессе.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+async def stress(args) -> dict:
+    import main
+
+    poll_id = main.create_poll(main.CreatePollRequest(question="Stress", options=["a", "b", "c", "d"]))["poll_id"]
+    option_keys = list(main.polls[poll_id]["options"])
+    expected = {key: 0 for key in option_keys}
+    plan = [random.choice(option_keys) for _ in range(args.votes)]
+    for key in plan:
+        expected[key] += 1
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        queue = iter(plan)
+
+        async def worker():
+            for key in queue:
+                response = await client.post(f"/api/poll/vote/{poll_id}/{key}")
+                response.raise_for_status()
+
+        async def snapshots():
+            # Снимки во время голосования проверяют согласованность с журналом
+            while not done.is_set():
+                await asyncio.to_thread(main.storage.snapshot, main.capture_state)
+                await asyncio.sleep(0.05)
+
+        done = asyncio.Event()
+        snapshot_task = asyncio.create_task(snapshots())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await snapshot_task
+
+    counted = main.counters[poll_id].totals()
+    print(f"{args.votes} votes in {elapsed:.2f}s ({args.votes / elapsed:,.0f} votes/s)")
+    print(f"expected: {expected}")
+    print(f"counted:  {counted}")
+    if counted != expected:
+        sys.exit("FAIL: votes lost in memory")
+    return {"poll_id": poll_id, "expected": expected}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--votes", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+    result = asyncio.run(stress(args))
+
+    # Имитация перезапуска: чтение снимка и журнала в новом процессе
+    check = (
+        "import json, main; "
+        f"print(json.dumps(main.counters[{result['poll_id']!r}].totals()))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", check], cwd=workdir, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": BACKEND_DIR}, check=True,
+    ).stdout
+    restored = json.loads(output.strip().splitlines()[-1])
+    print(f"restored: {restored}")
+    if restored != result["expected"]:
+        sys.exit("FAIL: votes lost between snapshot and log")
+    print("OK: no lost votes")
+
+
+if __name__ == "__main__":
+    main_cli()
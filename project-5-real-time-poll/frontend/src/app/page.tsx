@@ -13,12 +13,18 @@ interface Poll {
 
 export default function Home() {
   const [polls, setPolls] = useState<Poll[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+
+  // Без курсора - первая страница заново, с курсором - дозагрузка следующей
+  const fetchPolls = async (cursor: string | null = null) => {
+    const response = await axios.get(`${API_URL}/polls`, {
+      params: cursor ? { cursor } : {},
+    });
+    setPolls((prev) => (cursor ? [...prev, ...response.data.items] : response.data.items));
+    setNextCursor(response.data.next_cursor);
+  };
 
   useEffect(() => {
-    const fetchPolls = async () => {
-      const response = await axios.get(`${API_URL}/polls`);
-      setPolls(response.data);
-    };
     fetchPolls();
   }, []);
 
@@ -37,6 +43,11 @@ export default function Home() {
           </li>
         ))}
       </ul>
+      {nextCursor && (
+        <button onClick={() => fetchPolls(nextCursor)} className="px-4 py-2 bg-blue-500 text-white rounded">
+          Показать ещё
+        </button>
+      )}
     </main>
   );
 }
\ No newline at end of file
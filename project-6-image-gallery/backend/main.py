@@ -1,12 +1,45 @@
 import os
 import uuid
+import bisect
+import shutil
+import asyncio
+import hashlib
 import aiofiles
-from fastapi import FastAPI, UploadFile, File, HTTPException, Path
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Path, Query, Request
+from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from PIL import Image
+from pydantic import BaseModel
+from typing import Dict, List, Optional
 
-app = FastAPI()
+try:
+    from python_multipart import MultipartParser
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # старые версии python-multipart
+    from multipart import MultipartParser
+    from multipart.multipart import parse_options_header
+
+# --- Пул процессов для ресайза (Pillow держит GIL, в event loop его не пускаем) ---
+RESIZE_WORKERS = int(os.getenv("GALLERY_RESIZE_WORKERS", str(os.cpu_count() or 2)))
+resize_pool: Optional[ProcessPoolExecutor] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global resize_pool
+    resize_pool = ProcessPoolExecutor(max_workers=RESIZE_WORKERS)
+    await build_index()
+    try:
+        yield
+    finally:
+        resize_pool.shutdown(wait=True, cancel_futures=True)
+        resize_pool = None
+
+
+app = FastAPI(lifespan=lifespan)
 
 # --- CORS ---
 origins = ["http://localhost:3000"]
@@ -22,65 +55,512 @@ app.add_middleware(
 IMAGE_DIR = "static/images/"
 os.makedirs(IMAGE_DIR, exist_ok=True)
 
+# --- Уменьшенные копии: static/images/variants/<имя без расширения>/w<ширина>.webp ---
+VARIANT_DIR = os.path.join(IMAGE_DIR, "variants")
+os.makedirs(VARIANT_DIR, exist_ok=True)
+VARIANT_WIDTHS = sorted(
+    int(w) for w in os.getenv("GALLERY_VARIANT_WIDTHS", "200,400,800").split(",") if w.strip()
+)
+VARIANT_QUALITY = int(os.getenv("GALLERY_VARIANT_QUALITY", "80"))
+
 # --- Раздача статики ---
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # --- Максимальный размер файла: 5 МБ ---
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 мегабайт
+# Загрузка пишется на диск кусками такого размера - больше в памяти не держим
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Запас на заголовки multipart при проверке Content-Length
+MULTIPART_OVERHEAD = 16 * 1024
+# Временные файлы незавершённых загрузок (не показываются в списке)
+TEMP_PREFIX = ".upload-"
+
+# --- Распознавание формата по первым байтам файла ---
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+
+def sniff_image_extension(head: bytes) -> Optional[str]:
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class StreamingImageUpload:
+    """Разбирает multipart по мере поступления и пишет поле "file" во временный файл.
+
+    В памяти лежит не больше одного куска; загрузка обрывается, как только превышен MAX_FILE_SIZE.
+    """
+
+    def __init__(self, boundary: bytes, temp_path: str):
+        self.temp_path = temp_path
+        self.out = None
+        self.size = 0
+        self.head = b""
+        self.found_file = False
+        self.digest = hashlib.sha256()
+        self.buffer = bytearray()
+        self._in_file_part = False
+        self._header_field = b""
+        self._header_value = b""
+        self._disposition = b""
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._disposition = b""
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        self._in_file_part = options.get(b"name") == b"file" and not self.found_file
+        self.found_file = self.found_file or self._in_file_part
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if not self._in_file_part:
+            return
+        self.size += end - start
+        if self.size > MAX_FILE_SIZE:
+            raise UploadTooLarge()
+        if len(self.head) < 16:
+            self.head += data[start:min(end, start + 16)]
+        self.digest.update(data[start:end])
+        self.buffer += data[start:end]
+
+    def _on_part_end(self):
+        self._in_file_part = False
+
+    async def feed(self, chunk: bytes):
+        self.parser.write(chunk)
+        if len(self.buffer) >= UPLOAD_CHUNK_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        if self.out is None:
+            self.out = await aiofiles.open(self.temp_path, mode="wb")
+        await self.out.write(bytes(self.buffer))
+        self.buffer.clear()
+
+    async def finish(self):
+        self.parser.finalize()
+        await self.flush()
+        await self.close()
+
+    async def close(self):
+        if self.out is not None:
+            await self.out.close()
+            self.out = None
+
+
+def discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# --- Генерация вариантов ---
+def variant_stem(filename: str) -> str:
+    return os.path.splitext(filename)[0]
+
+
+def variant_path(filename: str, width: int) -> str:
+    return os.path.join(VARIANT_DIR, variant_stem(filename), f"w{width}.webp")
+
+
+def variant_url(filename: str, width: int) -> str:
+    return f"/static/images/variants/{variant_stem(filename)}/w{width}.webp"
+
+
+def render_variants(source_path: str, targets: Dict[int, str], quality: int) -> List[int]:
+    """Выполняется в процессе пула: один раз декодирует оригинал и пишет WebP нужных ширин.
+
+    Больше оригинала не увеличиваем - такая ширина получает копию в исходном размере.
+    """
+    done = []
+    with Image.open(source_path) as original:
+        original.seek(0)  # у GIF берём первый кадр
+        image = original.convert("RGBA" if original.mode in ("RGBA", "LA", "P") else "RGB")
+    # От большей ширины к меньшей: каждую следующую уменьшаем из предыдущей, а не из оригинала
+    for width in sorted(targets, reverse=True):
+        if width < image.width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        target = targets[width]
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp = f"{target}.{os.getpid()}.tmp"
+        image.save(temp, "WEBP", quality=quality)
+        os.replace(temp, target)
+        done.append(width)
+    return done
+
+
+# Запросы на одну и ту же ширину ждут одного и того же задания в пуле: (файл, ширина) -> задание
+variant_jobs: Dict[tuple, asyncio.Future] = {}
+
+
+def forget_job(keys: List[tuple], job: asyncio.Future):
+    for key in keys:
+        if variant_jobs.get(key) is job:
+            del variant_jobs[key]
+
+
+async def ensure_variants(filename: str, widths: List[int]):
+    jobs = []
+    missing = []
+    for width in widths:
+        job = variant_jobs.get((filename, width))
+        if job is None:
+            missing.append(width)
+        elif job not in jobs:
+            jobs.append(job)
+    if missing:
+        targets = {w: variant_path(filename, w) for w in missing}
+        source = os.path.join(IMAGE_DIR, filename)
+        loop = asyncio.get_running_loop()
+        job = asyncio.ensure_future(loop.run_in_executor(resize_pool, render_variants, source, targets, VARIANT_QUALITY))
+        keys = [(filename, w) for w in missing]
+        for key in keys:
+            variant_jobs[key] = job
+        job.add_done_callback(lambda done: forget_job(keys, done))
+        jobs.append(job)
+    # shield: отмена одного ожидающего запроса не отменяет задание для остальных
+    await asyncio.gather(*(asyncio.shield(job) for job in jobs))
+    record = image_index.records.get(filename)
+    if record is not None:
+        record.variants.update(widths)
+
+
+async def generate_variants_in_background(filename: str):
+    try:
+        await ensure_variants(filename, VARIANT_WIDTHS)
+    except Exception as e:
+        print(f"Variant generation for {filename} failed: {e}")
+
+
+# Ссылки на фоновые задачи, чтобы их не собрал GC до завершения
+background_jobs = set()
+
+
+# --- Индекс метаданных: строится один раз при старте, дальше его ведут загрузка и удаление ---
+# Одинаковые по содержимому загрузки не сохраняются повторно, а возвращают уже существующий файл
+DEDUP_UPLOADS = os.getenv("GALLERY_DEDUP", "0") == "1"
+MAX_PAGE_SIZE = 200
+
+
+def read_dimensions(path: str) -> tuple:
+    # Pillow читает только заголовок, пиксели не декодируются
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
+        return 0, 0
+
+
+def decoded_dimensions(path: str) -> Optional[tuple]:
+    """Размеры картинки, если Pillow декодирует её целиком, иначе None.
+
+    Одного заголовка мало: файл с верной сигнатурой и битым телом прошёл бы проверку,
+    а потом ломал бы построение каждого варианта.
+    """
+    try:
+        with Image.open(path) as image:
+            image.load()
+            return image.size
+    except Exception:
+        return None
+
+
+def describe_image(path: str) -> tuple:
+    """Выполняется в процессе пула: хэш содержимого и размеры картинки."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return (digest.hexdigest(), *read_dimensions(path))
+
+
+class ImageRecord:
+    __slots__ = ("filename", "size", "width", "height", "uploaded_ns", "content_hash", "variants")
+
+    def __init__(self, filename: str, size: int, width: int, height: int, uploaded_ns: int, content_hash: str):
+        self.filename = filename
+        self.size = size
+        self.width = width
+        self.height = height
+        self.uploaded_ns = uploaded_ns
+        self.content_hash = content_hash
+        self.variants = set()  # ширины, уже лежащие на диске
+
+
+class ImageIndex:
+    def __init__(self):
+        self.records: Dict[str, ImageRecord] = {}
+        # (-время загрузки, имя): отсортировано от новых к старым, курсор ищется через bisect
+        self.order: List[tuple] = []
+        self.by_hash: Dict[str, str] = {}
+
+    def add(self, record: ImageRecord):
+        self.records[record.filename] = record
+        bisect.insort(self.order, (-record.uploaded_ns, record.filename))
+        self.by_hash.setdefault(record.content_hash, record.filename)
+
+    def remove(self, filename: str) -> Optional[ImageRecord]:
+        record = self.records.pop(filename, None)
+        if record is None:
+            return None
+        key = (-record.uploaded_ns, filename)
+        position = bisect.bisect_left(self.order, key)
+        if position < len(self.order) and self.order[position] == key:
+            del self.order[position]
+        if self.by_hash.get(record.content_hash) == filename:
+            del self.by_hash[record.content_hash]
+            # без дедупликации могли остаться копии с тем же хэшем - редкий случай, ищем перебором
+            for other in self.records.values():
+                if other.content_hash == record.content_hash:
+                    self.by_hash[record.content_hash] = other.filename
+                    break
+        return record
+
+    def page(self, limit: int, cursor: Optional[str]) -> tuple:
+        start = 0
+        if cursor:
+            uploaded_ns, filename = cursor.split(":", 1)
+            start = bisect.bisect_right(self.order, (-int(uploaded_ns), filename))
+        keys = self.order[start:start + limit]
+        items = [self.records[filename] for _, filename in keys]
+        next_cursor = None
+        if start + limit < len(self.order) and items:
+            next_cursor = f"{items[-1].uploaded_ns}:{items[-1].filename}"
+        return items, next_cursor
+
+
+image_index = ImageIndex()
+
+
+async def build_index():
+    """Один проход os.scandir по папке картинок и один по папке вариантов; хэши считаются в пуле."""
+    files = []
+    with os.scandir(IMAGE_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            if entry.name.startswith(TEMP_PREFIX):
+                # хвост оборванной загрузки с прошлого запуска
+                discard(entry.path)
+                continue
+            files.append((entry.name, entry.path, entry.stat()))
+
+    variants: Dict[str, set] = {}
+    with os.scandir(VARIANT_DIR) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                variants[entry.name] = {
+                    int(name[1:-5]) for name in os.listdir(entry.path)
+                    if name.startswith("w") and name.endswith(".webp") and name[1:-5].isdigit()
+                }
+
+    loop = asyncio.get_running_loop()
+    described = await asyncio.gather(
+        *(loop.run_in_executor(resize_pool, describe_image, path) for _, path, _ in files),
+        return_exceptions=True,
+    )
+    for (name, _, stat), info in zip(files, described):
+        if isinstance(info, Exception):
+            print(f"Indexing {name} failed: {info}")
+            continue
+        content_hash, width, height = info
+        record = ImageRecord(name, stat.st_size, width, height, stat.st_mtime_ns, content_hash)
+        record.variants = variants.get(variant_stem(name), set())
+        image_index.add(record)
 
 
 # --- Загрузка изображений ---
-@app.post("/api/upload")
-async def upload_image(file: UploadFile = File(...)):
-    # Проверка контента
-    if not file.content_type or not file.content_type.startswith("image/"):
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    }
+}
+
+
+@app.post("/api/upload", openapi_extra=UPLOAD_OPENAPI)
+async def upload_image(request: Request):
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data upload.")
+
+    # Заведомо большой запрос отклоняем ещё до чтения тела
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_FILE_SIZE + MULTIPART_OVERHEAD:
+        raise HTTPException(status_code=413, detail="File is too large. Max size is 5 MB.")
+
+    upload_id = uuid.uuid4()
+    temp_path = os.path.join(IMAGE_DIR, f"{TEMP_PREFIX}{upload_id}")
+    upload = StreamingImageUpload(options[b"boundary"], temp_path)
+
+    # Потоковое чтение и запись кусками во временный файл
+    try:
+        async for chunk in request.stream():
+            await upload.feed(chunk)
+        await upload.finish()
+    except UploadTooLarge:
+        await upload.close()
+        discard(temp_path)
+        raise HTTPException(status_code=413, detail="File is too large. Max size is 5 MB.")
+    except Exception as e:
+        await upload.close()
+        discard(temp_path)
+        raise HTTPException(status_code=400, detail=f"Error reading upload: {e}")
+
+    if not upload.found_file or upload.size == 0:
+        discard(temp_path)
+        raise HTTPException(status_code=400, detail="No file uploaded.")
+
+    # Проверка контента по сигнатуре, а не по присланному content_type
+    file_extension = sniff_image_extension(upload.head)
+    if file_extension is None:
+        discard(temp_path)
         raise HTTPException(status_code=400, detail="Uploaded file is not an image.")
 
-    # Чтение и проверка размера
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File is too large. Max size is 5 MB.")
+    dimensions = await asyncio.to_thread(decoded_dimensions, temp_path)
+    if dimensions is None:
+        discard(temp_path)
+        raise HTTPException(status_code=400, detail="Uploaded file is not an image.")
+    width, height = dimensions
+    content_hash = upload.digest.hexdigest()
 
-    # Генерация уникального имени
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(IMAGE_DIR, unique_filename)
+    # Между проверкой и добавлением в индекс нет await - одинаковые параллельные загрузки не проскочат
+    if DEDUP_UPLOADS and content_hash in image_index.by_hash:
+        discard(temp_path)
+        return {"url": f"/static/images/{image_index.by_hash[content_hash]}", "duplicate": True}
 
-    # Асинхронное сохранение
+    # Публикация атомарным переименованием: в списке не бывает недописанных файлов
+    unique_filename = f"{upload_id}{file_extension}"
+    final_path = os.path.join(IMAGE_DIR, unique_filename)
     try:
-        async with aiofiles.open(file_path, mode='wb') as out_file:
-            await out_file.write(content)
+        os.replace(temp_path, final_path)
+        uploaded_ns = os.stat(final_path).st_mtime_ns
     except Exception as e:
+        discard(temp_path)
         raise HTTPException(status_code=500, detail=f"Error saving file: {e}")
+    image_index.add(ImageRecord(unique_filename, upload.size, width, height, uploaded_ns, content_hash))
+
+    # Варианты строятся в пуле процессов после ответа; пока их нет - отдаёт /variants/{width}
+    task = asyncio.create_task(generate_variants_in_background(unique_filename))
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
 
     # Возврат URL
     return {"url": f"/static/images/{unique_filename}"}
 
 
+# --- Вариант нужной ширины по запросу (дисковый кэш + single-flight) ---
+@app.get("/api/images/{filename}/variants/{width}")
+async def get_variant(filename: str = Path(...), width: int = Path(...)):
+    if width not in VARIANT_WIDTHS:
+        raise HTTPException(status_code=400, detail=f"Width must be one of {VARIANT_WIDTHS}.")
+    if os.path.basename(filename) != filename or filename.startswith(TEMP_PREFIX):
+        raise HTTPException(status_code=400, detail="Invalid filename.")
+    record = image_index.records.get(filename)
+    if record is None:
+        raise HTTPException(status_code=404, detail="File not found.")
+
+    path = variant_path(filename, width)
+    if width not in record.variants:
+        try:
+            await ensure_variants(filename, [width])
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error generating variant: {e}")
+    return FileResponse(path, media_type="image/webp", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+
 # --- Список изображений ---
-@app.get("/api/images", response_model=List[str])
-async def get_images():
+class ImageInfo(BaseModel):
+    url: str
+    filename: str
+    size: int
+    width: int
+    height: int
+    uploaded_at: float
+    content_hash: str
+    # ширина -> URL готового WebP; отсутствующие ширины доступны через /api/images/{filename}/variants/{width}
+    variants: Dict[int, str]
+
+
+class ImagePage(BaseModel):
+    items: List[ImageInfo]
+    next_cursor: Optional[str]
+
+
+def image_info(record: ImageRecord) -> ImageInfo:
+    return ImageInfo(
+        url=f"/static/images/{record.filename}",
+        filename=record.filename,
+        size=record.size,
+        width=record.width,
+        height=record.height,
+        uploaded_at=record.uploaded_ns / 1e9,
+        content_hash=record.content_hash,
+        variants={w: variant_url(record.filename, w) for w in VARIANT_WIDTHS if w in record.variants},
+    )
+
+
+# Новые первыми; список берётся из индекса без обращений к диску
+@app.get("/api/images", response_model=ImagePage)
+async def get_images(limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None):
     try:
-        images = os.listdir(IMAGE_DIR)
-        image_urls = [
-            f"/static/images/{img}"
-            for img in images
-            if os.path.isfile(os.path.join(IMAGE_DIR, img))
-        ]
-        return image_urls
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error reading image directory: {e}")
+        records, next_cursor = image_index.page(limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return ImagePage(items=[image_info(record) for record in records], next_cursor=next_cursor)
 
 
 # --- Удаление изображения ---
 @app.delete("/api/images/{filename}")
 async def delete_image(filename: str = Path(...)):
-    file_path = os.path.join(IMAGE_DIR, filename)
-    if not os.path.exists(file_path):
+    if filename not in image_index.records:
         raise HTTPException(status_code=404, detail="File not found.")
 
     try:
-        os.remove(file_path)
+        discard(os.path.join(IMAGE_DIR, filename))
+        image_index.remove(filename)
+        shutil.rmtree(os.path.join(VARIANT_DIR, variant_stem(filename)), ignore_errors=True)
         return {"message": "File deleted successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting file: {e}")
\ No newline at end of file
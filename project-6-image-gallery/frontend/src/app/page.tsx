@@ -6,17 +6,40 @@ import Image from 'next/image';
 
 const API_URL = 'http://localhost:8000';
 
+interface GalleryImage {
+  url: string;
+  filename: string;
+  // ширина -> URL уменьшенной WebP-копии
+  variants: Record<string, string>;
+}
+
+const toAbsolute = (url: string) =>
+  url.startsWith('http://') || url.startsWith('https://')
+    ? url
+    : `${API_URL}${url.startsWith('/') ? '' : '/'}${url}`;
+
+// Для плитки сетки хватает копии шириной 400px; если её ещё нет - берём эндпоинт, который её построит
+const thumbnailUrl = (img: GalleryImage) => {
+  if (img.variants['400']) return toAbsolute(img.variants['400']);
+  return `${API_URL}/api/images/${img.filename}/variants/400`;
+};
+
 export default function Home() {
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
-  const [images, setImages] = useState<string[]>([]);
+  const [images, setImages] = useState<GalleryImage[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [error, setError] = useState('');
   const [uploading, setUploading] = useState(false);
   const [progress, setProgress] = useState(0);
 
-  const fetchImages = async () => {
+  // Без курсора - первая страница заново, с курсором - дозагрузка следующей
+  const fetchImages = async (cursor: string | null = null) => {
     try {
-      const response = await axios.get(`${API_URL}/api/images`);
-      setImages(response.data);
+      const response = await axios.get(`${API_URL}/api/images`, {
+        params: cursor ? { cursor } : {},
+      });
+      setImages((prev) => (cursor ? [...prev, ...response.data.items] : response.data.items));
+      setNextCursor(response.data.next_cursor);
     } catch (err) {
       console.error('Failed to fetch images:', err);
       setError('Не удалось загрузить галерею.');
@@ -66,10 +89,7 @@ export default function Home() {
     }
   };
 
-  const handleDelete = async (url: string) => {
-    const filename = url.split('/').pop();
-    if (!filename) return;
-
+  const handleDelete = async (filename: string) => {
     try {
       await axios.delete(`${API_URL}/api/images/${filename}`);
       fetchImages();
@@ -121,22 +141,19 @@ export default function Home() {
       </form>
 
       <div className="grid grid-cols-1 sm:grid-cols-2 md:grid-cols-3 lg:grid-cols-4 gap-4">
-        {images.map((imgUrl, index) => (
-          <div key={index} className="relative aspect-square rounded-lg overflow-hidden shadow-lg group">
+        {images.map((img, index) => (
+          <div key={img.url} className="relative aspect-square rounded-lg overflow-hidden shadow-lg group">
             <Image
-              src={
-                imgUrl.startsWith('http://') || imgUrl.startsWith('https://')
-                  ? imgUrl
-                  : `${API_URL}${imgUrl.startsWith('/') ? '' : '/'}${imgUrl}`
-              }
+              src={thumbnailUrl(img)}
               alt={`Uploaded image ${index + 1}`}
               fill
               className="object-cover"
               sizes="(max-width: 768px) 100vw, (max-width: 1200px) 50vw, 33vw"
+              unoptimized
               priority={index < 4}
             />
             <button
-              onClick={() => handleDelete(imgUrl)}
+              onClick={() => handleDelete(img.filename)}
               className="absolute top-2 right-2 bg-white text-red-500 rounded-full p-1 shadow-md opacity-0 group-hover:opacity-100 transition"
               title="Удалить"
             >
@@ -145,6 +162,17 @@ export default function Home() {
           </div>
         ))}
       </div>
+
+      {nextCursor && (
+        <div className="text-center mt-8">
+          <button
+            onClick={() => fetchImages(nextCursor)}
+            className="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded"
+          >
+            Показать ещё
+          </button>
+        </div>
+      )}
     </main>
   );
 }
\ No newline at end of file
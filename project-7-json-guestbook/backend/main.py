@@ -1,20 +1,56 @@
 import json
 import uuid
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime, timezone
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from pydantic import BaseModel
-from typing import List
-import aiofiles
+from typing import Dict, List, Optional, Tuple
 import os
+from itertools import islice
 
-app = FastAPI()
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки между процессами нет, остаётся сверка размера
+    fcntl = None
+
+try:
+    # orjson сериализует списки словарей в разы быстрее стандартного json
+    import orjson
+
+    def dump_json(data) -> bytes:
+        return orjson.dumps(data)
+except ImportError:
+    def dump_json(data) -> bytes:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    store.open()
+    compactor = asyncio.create_task(run_compactor())
+    try:
+        yield
+    finally:
+        compactor.cancel()
+        store.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # --- CORS ---
 origins = ["http://localhost:3000"]
 app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
-DB_FILE = "data/guestbook.json"
+# Журнал записей: одна JSON-строка на добавление/изменение, удаление - строка-надгробие
+DB_FILE = os.getenv("GUESTBOOK_DB", "data/guestbook.jsonl")
+# Старый формат (один JSON-массив) импортируется при первом запуске
+LEGACY_DB_FILE = "data/guestbook.json"
+# Сжатие журнала: когда мёртвых строк не меньше порога и больше, чем живых
+COMPACT_INTERVAL = float(os.getenv("GUESTBOOK_COMPACT_INTERVAL", "30"))
+COMPACT_MIN_DEAD = int(os.getenv("GUESTBOOK_COMPACT_MIN_DEAD", "1000"))
 
 # --- Pydantic модели ---
 class GuestbookEntry(BaseModel):
@@ -30,32 +66,307 @@ class EntryCreate(BaseModel):
 class EntryUpdate(BaseModel):
     message: str
 
-# --- Вспомогательные функции для работы с файлом ---
-async def read_db() -> List[GuestbookEntry]:
-    async with aiofiles.open(DB_FILE, mode='r', encoding='utf-8') as f:
-        content = await f.read()
-        if not content:
-            return []
-        data = json.loads(content)
-        return [GuestbookEntry(**item) for item in data]
-
-async def write_db(data: List[GuestbookEntry]):
-    # Преобразуем объекты Pydantic в словари для сериализации в JSON
-    export_data = [item.model_dump(mode='json') for item in data]
-    async with aiofiles.open(DB_FILE, mode='w', encoding='utf-8') as f:
-        await f.write(json.dumps(export_data, indent=4, ensure_ascii=False))
+# --- Хранилище: журнал JSONL + индекс id -> (смещение, длина) ---
+def encode_line(record: dict) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class GuestbookStore:
+    """Добавление, изменение и удаление дописывают одну строку в конец журнала - O(1).
+
+    В памяти только индекс id -> (смещение, длина) последней версии записи, в порядке
+    создания. Чтение идёт через os.pread без await, поэтому подмена файла при сжатии
+    не может случиться посреди чтения. Запись и сжатие идут под asyncio-блокировкой.
+
+    Разобранные записи кэшируются по смещению: запись, которую сервер сам только что
+    сделал, попадает в кэш без разбора, а старый кэш отпадает сам, как только у записи
+    меняется смещение. Чужие дописанные строки (размер больше self.size) разбираются
+    с хвоста, подменённый файл читается заново.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index: Dict[str, Tuple[int, int]] = {}
+        self.size = 0
+        self.dead = 0  # строк в журнале, которые уже ничего не значат
+        self.lock = asyncio.Lock()
+        self.reader = None
+        self.writer = None
+        self.parsed: Dict[str, Tuple[int, dict]] = {}
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._file_lock():
+            # Под блокировкой ничья запись не идёт: недописанный хвост - след сбоя
+            self._open_locked(truncate_torn_tail=True)
+
+    def _open_locked(self, truncate_torn_tail: bool = False):
+        self.index, self.size, self.dead = {}, 0, 0
+        self.parsed = {}
+        if not os.path.exists(self.path) and os.path.exists(LEGACY_DB_FILE):
+            self._import_legacy()
+        if os.path.exists(self.path):
+            self._load(truncate_torn_tail)
+        self.writer = open(self.path, "ab")
+        self.reader = open(self.path, "rb")
+
+    def _changed_on_disk(self) -> bool:
+        try:
+            on_disk = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return on_disk.st_ino != os.fstat(self.reader.fileno()).st_ino or on_disk.st_size != self.size
+
+    def refresh_if_changed(self):
+        if self.lock.locked() or not self._changed_on_disk():
+            return  # идёт наша собственная запись или сжатие, либо журнал не менялся
+        # Не ждём чужую запись в event loop: не удалось взять блокировку - догоним позже
+        with self._file_lock(shared=True, wait=False) as locked:
+            if locked:
+                self._sync_with_disk()
+
+    def _sync_with_disk(self):
+        """Догоняет изменения других процессов. Вызывается под _file_lock.
+
+        Свои записи сдвигают self.size ровно на записанные байты, поэтому любое
+        расхождение с реальным концом файла означает чужую запись: если файл тот же,
+        разбираются только новые байты, если его подменили - журнал читается заново.
+        """
+        try:
+            on_disk = os.stat(self.path)
+        except FileNotFoundError:
+            on_disk = None
+        if on_disk is None or on_disk.st_ino != os.fstat(self.reader.fileno()).st_ino or on_disk.st_size < self.size:
+            self.close()
+            self._open_locked()
+        elif on_disk.st_size > self.size:
+            tail = os.pread(self.reader.fileno(), on_disk.st_size - self.size, self.size)
+            self.size += self._apply_lines(tail, self.size)
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False, wait: bool = True):
+        """Блокировка журнала между процессами (воркеры uvicorn) на время сверки и записи.
+
+        Берётся на отдельном файле .lock: сам журнал при сжатии подменяется новым.
+        Отдаёт True, если блокировка взята; с wait=False не ждёт и отдаёт False.
+        """
+        if fcntl is None:
+            yield True
+            return
+        with open(self.path + ".lock", "ab") as lock_file:
+            mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            try:
+                fcntl.flock(lock_file.fileno(), mode if wait else mode | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def close(self):
+        for f in (self.writer, self.reader):
+            if f is not None:
+                f.close()
+        self.writer = self.reader = None
+
+    def _import_legacy(self):
+        with open(LEGACY_DB_FILE, "r", encoding="utf-8") as f:
+            content = f.read()
+        entries = json.loads(content) if content.strip() else []
+        self._write_atomically(b"".join(encode_line(entry) for entry in entries))
+
+    def _load(self, truncate_torn_tail: bool):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.size = self._apply_lines(data, 0)
+        if truncate_torn_tail and self.size != len(data):
+            os.truncate(self.path, self.size)  # запись оборвалась при сбое
+
+    def _apply_lines(self, data: bytes, base: int) -> int:
+        """Применяет к индексу целые строки журнала, начиная со смещения base.
+
+        Возвращает число разобранных байт: строка без перевода строки ещё пишется
+        (или оборвалась при сбое) и остаётся на следующий раз.
+        """
+        pos = 0
+        while True:
+            end = data.find(b"\n", pos)
+            if end == -1:
+                return pos
+            record = json.loads(data[pos:end])
+            if record.get("deleted"):
+                self.dead += 1 + (self.index.pop(record["id"], None) is not None)
+                self.parsed.pop(record["id"], None)
+            else:
+                if record["id"] in self.index:
+                    self.dead += 1
+                # dict сохраняет место ключа при перезаписи - порядок остаётся порядком создания
+                self.index[record["id"]] = (base + pos, end - pos)
+            pos = end + 1
+
+    def _write_atomically(self, content: bytes):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _append(self, line: bytes) -> int:
+        # Смещение - реальный конец файла, а не закэшированный размер
+        offset = os.fstat(self.writer.fileno()).st_size
+        self.writer.write(line)
+        self.writer.flush()
+        self.size = offset + len(line)
+        return offset
+
+    def _store(self, record: dict, line: bytes):
+        offset = self._append(line)
+        self.index[record["id"]] = (offset, len(line) - 1)
+        self.parsed[record["id"]] = (offset, record)
+
+    def get(self, entry_id: str) -> Optional[dict]:
+        location = self.index.get(entry_id)
+        if location is None:
+            return None
+        offset, length = location
+        cached = self.parsed.get(entry_id)
+        if cached is not None and cached[0] == offset:
+            return cached[1]
+        record = json.loads(os.pread(self.reader.fileno(), length, offset))
+        self.parsed[entry_id] = (offset, record)
+        return record
+
+    def newest_first(self, skip: int, limit: int) -> List[dict]:
+        """Страница от новых к старым: разбираются только записи этой страницы."""
+        ids = islice(reversed(self.index), skip, skip + limit)
+        return [self.get(entry_id) for entry_id in ids]
+
+    async def put(self, record: dict):
+        line = encode_line(record)
+        async with self.lock:
+            with self._file_lock():
+                self._sync_with_disk()
+                if record["id"] in self.index:
+                    self.dead += 1
+                self._store(record, line)
+
+    async def replace(self, record: dict) -> bool:
+        """Как put, но только для существующей записи: параллельное удаление побеждает."""
+        line = encode_line(record)
+        async with self.lock:
+            with self._file_lock():
+                self._sync_with_disk()
+                if record["id"] not in self.index:
+                    return False
+                self.dead += 1
+                self._store(record, line)
+                return True
+
+    async def delete(self, entry_id: str) -> bool:
+        async with self.lock:
+            with self._file_lock():
+                self._sync_with_disk()
+                if entry_id not in self.index:
+                    return False
+                self._append(encode_line({"id": entry_id, "deleted": True}))
+                del self.index[entry_id]
+                self.parsed.pop(entry_id, None)
+                self.dead += 2  # старая версия и само надгробие
+                return True
+
+    def compaction_due(self) -> bool:
+        return self.dead >= COMPACT_MIN_DEAD and self.dead > len(self.index)
+
+    async def compact(self):
+        async with self.lock:
+            base = self.size
+            inode = os.fstat(self.reader.fileno()).st_ino
+            data = os.pread(self.reader.fileno(), base, 0)
+            index = {}
+            chunks = []
+            offset = 0
+            for entry_id, (old_offset, length) in self.index.items():
+                chunks.append(data[old_offset:old_offset + length + 1])
+                index[entry_id] = (offset, length)
+                offset += length + 1
+            # Запись, блокировка и подмена файла - в потоке: event loop не ждёт flock
+            tail = await asyncio.to_thread(self._rewrite, b"".join(chunks), base, inode)
+            if tail is None:
+                return  # журнал уже подменил другой процесс, его подхватит refresh
+            # Файл, индекс и дескрипторы меняются без await между ними
+            self.close()
+            self.writer = open(self.path, "ab")
+            self.reader = open(self.path, "rb")
+            self.index = index
+            self.size = offset
+            self.dead = 0
+            # Разобранные записи переживают сжатие, меняются только их смещения
+            self.parsed = {
+                entry_id: (index[entry_id][0], record)
+                for entry_id, (_, record) in self.parsed.items() if entry_id in index
+            }
+            # Строки, дописанные другими процессами во время сжатия, перенесены как есть
+            self.size += self._apply_lines(tail, offset)
+
+    def _rewrite(self, content: bytes, base: int, inode: int) -> Optional[bytes]:
+        """Пишет сжатый журнал и подменяет им старый. Возвращает перенесённый хвост.
+
+        Основная часть пишется без блокировки; под flock дописываются только строки,
+        появившиеся после base, так что чужие воркеры ждут лишь подмену файла.
+        """
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+            with self._file_lock():
+                try:
+                    replaced = os.stat(self.path).st_ino != inode
+                except FileNotFoundError:
+                    replaced = True
+                if replaced:
+                    f.close()
+                    os.remove(tmp_path)
+                    return None
+                with open(self.path, "rb") as log:
+                    log.seek(base)
+                    tail = log.read()
+                tail = tail[:tail.rfind(b"\n") + 1]  # только целые строки
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+        return tail
+
+store = GuestbookStore(DB_FILE)
+
+
+async def run_compactor():
+    while True:
+        await asyncio.sleep(COMPACT_INTERVAL)
+        if store.compaction_due():
+            try:
+                await store.compact()
+            except Exception as e:
+                print(f"Guestbook compaction failed: {e}")
+
 
 # --- Эндпоинты API ---
+def fast_json(data) -> Response:
+    return Response(content=dump_json(data), media_type="application/json")
+
+
+# Записи из журнала сервер писал сам, поэтому они отдаются без повторной валидации через GuestbookEntry
 @app.get("/api/entries", response_model=List[GuestbookEntry])
-async def get_all_entries():
-    """Возвращает все записи из гостевой книги."""
-    return await read_db()
+async def get_entries(page: int = Query(1, ge=1), limit: int = Query(10, ge=1, le=100)):
+    """Возвращает страницу записей гостевой книги, новые первыми."""
+    store.refresh_if_changed()
+    return fast_json(store.newest_first((page - 1) * limit, limit))
 
 @app.post("/api/entries", response_model=GuestbookEntry, status_code=201)
 async def create_entry(entry_data: EntryCreate):
     """Добавляет новую запись в гостевую книгу."""
-    entries = await read_db()
-
     new_entry = GuestbookEntry(
         id=str(uuid.uuid4()),
         name=entry_data.name,
@@ -63,45 +374,21 @@ async def create_entry(entry_data: EntryCreate):
         timestamp=datetime.now(timezone.utc)
     )
 
-    entries.append(new_entry)
-    await write_db(entries)
+    await store.put(new_entry.model_dump(mode='json'))
 
     return new_entry
 
 @app.delete("/api/entries/{entry_id}", status_code=204)
 async def delete_entry(entry_id:str):
-    entries=await read_db()
-    filtred_entries=[entry for entry in entries if entry.id != entry_id]
-
-    if len(filtred_entries)==len(entries):
+    if not await store.delete(entry_id):
         raise HTTPException(status_code=404, detail="Здесь не найдена")
-    await write_db(filtred_entries)
 
 @app.put("/api/entries/{entry_id}", response_model=GuestbookEntry)
 async def update_entry(entry_id: str, updated_data: EntryUpdate):
-    entries = await read_db()
-    for entry in entries:
-        if entry.id == entry_id:
-            entry.message = updated_data.message
-            await write_db(entries)
-            return entry
-    raise HTTPException(status_code=404, detail="Запись не найдена")
-
-@app.get("/api/entries", response_model=List[GuestbookEntry])
-async def get_entries(page: int = 1, limit: int = 10):
-    entries = await read_db()
-    start = (page - 1) * limit
-    end = start + limit
-    return entries[start:end]
-
-async def read_db() -> List[GuestbookEntry]:
-    if not os.path.exists(DB_FILE):
-        async with aiofiles.open(DB_FILE, mode='w', encoding='utf-8') as f:
-            await f.write("[]")
-
-    async with aiofiles.open(DB_FILE, mode='r', encoding='utf-8') as f:
-        content = await f.read()
-        if not content:
-            return []
-        data = json.loads(content)
-        return [GuestbookEntry(**item) for item in data]
\ No newline at end of file
+    item = store.get(entry_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Запись не найдена")
+    entry = {**item, "message": updated_data.message}
+    if not await store.replace(entry):
+        raise HTTPException(status_code=404, detail="Запись не найдена")
+    return fast_json(entry)
@@ -27,11 +27,9 @@ export default function Home() {
 
   const fetchEntries = async () => {
     try {
+      // Сервер отдаёт страницу уже отсортированной: новые первыми
       const response = await axios.get(`${API_URL}?page=${page}&limit=${limit}`);
-      const sortedEntries = response.data.sort((a: Entry, b: Entry) =>
-        new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime()
-      );
-      setEntries(sortedEntries);
+      setEntries(response.data);
     } catch (err) {
       setError('Не удалось загрузить записи.');
     }
@@ -187,7 +185,8 @@ export default function Home() {
           <span>Страница {page}</span>
           <button
             onClick={() => setPage((p) => p + 1)}
-            className="bg-gray-300 hover:bg-gray-400 px-4 py-2 rounded"
+            disabled={entries.length < limit}
+            className="bg-gray-300 hover:bg-gray-400 px-4 py-2 rounded disabled:opacity-50"
           >
             Вперед
           </button>
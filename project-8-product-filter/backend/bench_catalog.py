@@ -0,0 +1,139 @@
+"""Сравнение каталогов: список словарей против колонок NumPy.
+
+Запуск из папки backend:
+    python bench_catalog.py --sizes 10000 100000 1000000 --seconds 2
+
+Для каждого размера генерируется синтетический каталог и измеряются:
+  * память, которую удерживает каждое представление, и время построения
+    (оба под tracemalloc, поэтому время завышено одинаково для всех путей);
+  * запросов в секунду на наборе типичных фильтров (qps) и отдельно на узких
+    фильтрах с маленьким результатом (narrow qps) для трёх путей:
+    scan  - исходная фильтрация списковыми выражениями по PRODUCTS_DB,
+    index - Catalog (индексы поверх списка словарей),
+    numpy - ColumnarCatalog (векторные маски).
+Сериализация ответа в JSON не входит в замер - только сам запрос. На широких
+запросах numpy-путь упирается в сборку словарей для строк результата.
+"""
+import gc
+import time
+import random
+import argparse
+import tracemalloc
+
+import main
+
+WORDS = ["Смартфон", "Ноутбук", "Книга", "Часы", "Alpha", "Pro", "код", "Худи",
+         "Джинсы", "Max", "Mini", "Chronos", "SoundWave", "Классика", "Логотип"]
+CATEGORIES = ["Электроника", "Одежда", "Книги", "Дом", "Спорт", "Игрушки", "Авто", "Сад"]
+
+QUERIES = [
+    {},
+    {"category": "Книги"},
+    {"search": "код"},
+    {"min_price": 100, "max_price": 200},
+    {"category": "Одежда", "max_price": 50, "sort": "price_asc"},
+    {"search": "pro max", "sort": "price_desc"},
+]
+# Запросы, чей результат - доли процента каталога
+NARROW_QUERIES = QUERIES[-2:]
+
+
+def make_products(count: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    return [
+        {
+            "id": i,
+            "name": f"{' '.join(rng.sample(WORDS, 2))} {i}",
+            "category": rng.choice(CATEGORIES),
+            "price": rng.randint(1, 2000),
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def scan_query(products, search=None, category=None, min_price=None, max_price=None, sort=None):
+    # Старый путь filter_products: новый список на каждый фильтр + сортировка копии
+    filtered = products
+    if category and category.lower() != "all":
+        filtered = [p for p in filtered if p["category"].lower() == category.lower()]
+    if search:
+        filtered = [p for p in filtered if search.lower() in p["name"].lower()]
+    if min_price is not None:
+        filtered = [p for p in filtered if p["price"] >= min_price]
+    if max_price is not None:
+        filtered = [p for p in filtered if p["price"] <= max_price]
+    if sort == "price_asc":
+        filtered = sorted(filtered, key=lambda x: x["price"])
+    elif sort == "price_desc":
+        filtered = sorted(filtered, key=lambda x: x["price"], reverse=True)
+    return filtered
+
+
+def measure_memory(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    built = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return built, retained
+
+
+def measure_qps(run_query, seconds: float, queries=QUERIES) -> float:
+    done = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for query in queries:
+            run_query(query)
+        done += len(queries)
+        if time.perf_counter() >= deadline:
+            break
+    return done / (time.perf_counter() - start)
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--seconds", type=float, default=2.0, help="время замера на один путь")
+    args = parser.parse_args()
+
+    if main.np is None:
+        raise SystemExit("numpy is not installed: pip install numpy")
+
+    print(f"{'size':>9} {'path':>6} {'memory MB':>10} {'build s':>8} {'qps':>10} {'narrow qps':>11}")
+    for size in args.sizes:
+        products, dicts_memory = measure_memory(lambda: make_products(size))
+
+        start = time.perf_counter()
+        index, index_memory = measure_memory(lambda: main.Catalog(products))
+        index_build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columnar, columnar_memory = measure_memory(lambda: main.ColumnarCatalog.from_products(products))
+        columnar_build = time.perf_counter() - start
+
+        # Ответы всех путей должны совпадать, иначе сравнивать нечего
+        for query in QUERIES:
+            expected = [p["id"] for p in scan_query(products, **query)]
+            assert [p["id"] for p in index.query(**query)] == expected, query
+            assert [p["id"] for p in columnar.query(**query)] == expected, query
+
+        paths = [
+            # scan и index держат сам список словарей, index - ещё и свои индексы поверх него
+            ("scan", dicts_memory, 0.0, lambda q: scan_query(products, **q)),
+            ("index", dicts_memory + index_memory, index_build, lambda q: index.query(**q)),
+            ("numpy", columnar_memory, columnar_build, lambda q: columnar.query(**q)),
+        ]
+        for path, memory, build, run_query in paths:
+            qps = measure_qps(run_query, args.seconds)
+            narrow_qps = measure_qps(run_query, args.seconds, NARROW_QUERIES)
+            print(f"{size:>9} {path:>6} {memory / 2**20:>10.1f} {build:>8.2f} {qps:>10.1f} {narrow_qps:>11.1f}")
+
+        del products, index, columnar, paths
+        gc.collect()
+
+
+if __name__ == "__main__":
+    main_bench()
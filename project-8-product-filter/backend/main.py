@@ -1,7 +1,16 @@
-from fastapi import FastAPI
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from fastapi import FastAPI, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # колоночный каталог опционален
+    np = None
 
 app = FastAPI()
 
@@ -29,38 +38,503 @@ class Product(BaseModel):
     category: str
     price: float
 
+# --- Индексы каталога ---
+# Длина n-грамм для поиска по названию; запросы короче проверяются подстрокой по кандидатам
+NGRAM = 3
+# Если результат больше этой доли каталога, порядок берём проходом по готовой сортировке, а не sort()
+PRESORTED_WALK_FRACTION = 8
+
+
+def ngrams(text: str) -> set:
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+# --- Фасеты: число товаров по категориям и гистограмма цен ---
+# Границы корзин гистограммы считаются по всему каталогу, чтобы не прыгали от фильтра к фильтру
+FACET_PRICE_BUCKETS = int(os.getenv("FACET_PRICE_BUCKETS", "10"))
+
+
+def price_buckets(low: float, high: float, buckets: int) -> Tuple[float, float]:
+    """(начало, ширина корзины); при одной цене на весь каталог ширина условная."""
+    width = (high - low) / buckets if high > low else 1.0
+    return low, width
+
+
+def facet_result(category_names: List[str], counts: List[int], histogram: List[int],
+                 low: float, width: float, total: int) -> dict:
+    return {
+        "total": total,
+        "categories": sorted(
+            ({"name": name, "count": count} for name, count in zip(category_names, counts)),
+            key=lambda facet: facet["name"],
+        ),
+        "price_histogram": [
+            {"min": round(low + width * i, 2), "max": round(low + width * (i + 1), 2), "count": count}
+            for i, count in enumerate(histogram)
+        ],
+    }
+
+
+class Catalog:
+    """Неизменяемые индексы поверх списка товаров; запросы никогда не меняют сам список.
+
+    Товары адресуются позицией в исходном списке. Фильтр с самым маленьким набором
+    кандидатов (категория, диапазон цен или n-граммы поиска) перебирается, остальные
+    проверяются по позиции за O(1), так что запрос стоит примерно столько, сколько
+    кандидатов у самого узкого фильтра.
+    """
+
+    def __init__(self, products: Iterable[dict]):
+        self.products = tuple(products)
+        count = len(self.products)
+        self.names = [p["name"].casefold() for p in self.products]
+        self.prices = array("d", (p["price"] for p in self.products))
+
+        # Категория -> код и список позиций (по возрастанию позиции)
+        self.category_codes: Dict[str, int] = {}
+        self.category_names: List[str] = []
+        self.codes = array("i")
+        self.by_category: List[array] = []
+        for position, product in enumerate(self.products):
+            key = product["category"].casefold()
+            code = self.category_codes.get(key)
+            if code is None:
+                code = self.category_codes[key] = len(self.by_category)
+                self.category_names.append(product["category"])
+                self.by_category.append(array("i"))
+            self.codes.append(code)
+            self.by_category[code].append(position)
+
+        # Готовые порядки; sort() стабилен, поэтому равные цены идут в исходном порядке, как раньше
+        self.price_asc = array("i", sorted(range(count), key=self.prices.__getitem__))
+        self.price_desc = array("i", sorted(range(count), key=self.prices.__getitem__, reverse=True))
+        self.sorted_prices = array("d", (self.prices[i] for i in self.price_asc))
+        self.asc_rank = self._ranks(self.price_asc)
+        self.desc_rank = self._ranks(self.price_desc)
+        self.sorted_categories = sorted(self.category_names)
+        self.price_range = (self.sorted_prices[0], self.sorted_prices[-1]) if count else (0.0, 0.0)
+
+        # n-грамма -> позиции товаров, в названии которых она есть
+        self.grams: Dict[str, array] = {}
+        for position, name in enumerate(self.names):
+            for gram in ngrams(name):
+                postings = self.grams.get(gram)
+                if postings is None:
+                    postings = self.grams[gram] = array("i")
+                postings.append(position)
+
+    @staticmethod
+    def _ranks(order: array) -> array:
+        ranks = array("i", bytes(4 * len(order)))
+        for rank, position in enumerate(order):
+            ranks[position] = rank
+        return ranks
+
+    def category_code(self, category: Optional[str]) -> Optional[int]:
+        """None - фильтра по категории нет, -1 - такой категории в каталоге нет."""
+        if not category or category.casefold() == "all":
+            return None
+        return self.category_codes.get(category.casefold(), -1)
+
+    def _select(self, search, category, min_price, max_price) -> Tuple[List[int], Optional[str]]:
+        """Позиции, прошедшие фильтры, и какой фильтр их перебирал (от него зависит порядок)."""
+        count = len(self.products)
+        # Источники кандидатов: (размер, вид, позиции)
+        sources = []
+        checks = []
+
+        code = self.category_code(category)
+        if code == -1:
+            return [], None
+        if code is not None:
+            sources.append((len(self.by_category[code]), "category", self.by_category[code]))
+
+        has_price = min_price is not None or max_price is not None
+        if has_price:
+            low = -float("inf") if min_price is None else min_price
+            high = float("inf") if max_price is None else max_price
+            start = bisect_left(self.sorted_prices, low)
+            end = bisect_right(self.sorted_prices, high)
+            if start >= end:
+                return [], None
+            sources.append((end - start, "price", range(start, end)))
+
+        needle = search.casefold() if search else None
+        if needle and len(needle) >= NGRAM:
+            postings = []
+            for gram in ngrams(needle):
+                gram_postings = self.grams.get(gram)
+                if gram_postings is None:
+                    return [], None
+                postings.append(gram_postings)
+            smallest = min(postings, key=len)
+            sources.append((len(smallest), "search", smallest))
+
+        if not sources:
+            candidates = range(count)
+            driver = None
+        else:
+            _, driver, candidates = min(sources, key=lambda source: source[0])
+            if driver == "price":
+                candidates = (self.price_asc[rank] for rank in candidates)
+
+        # Остальные фильтры - проверки по позиции; подстрока проверяется всегда (n-граммы дают лишних)
+        codes, prices, names = self.codes, self.prices, self.names
+        if code is not None and driver != "category":
+            checks.append(lambda i: codes[i] == code)
+        if has_price and driver != "price":
+            checks.append(lambda i: low <= prices[i] <= high)
+        if needle:
+            checks.append(lambda i: needle in names[i])
+
+        if checks:
+            positions = [i for i in candidates if all(check(i) for check in checks)]
+        else:
+            positions = list(candidates)
+        return positions, driver
+
+    def query(
+        self,
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: Optional[str] = None,
+    ) -> List[dict]:
+        count = len(self.products)
+        positions, driver = self._select(search, category, min_price, max_price)
+
+        # Кандидаты из категории и поиска идут в исходном порядке, из цены - по возрастанию цены
+        if sort == "price_asc" and driver != "price":
+            positions = self._ordered(positions, self.price_asc, self.asc_rank)
+        elif sort == "price_desc":
+            positions = self._ordered(positions, self.price_desc, self.desc_rank)
+        elif sort not in ("price_asc", "price_desc") and driver == "price":
+            positions = self._ordered(positions, range(count), None)
+
+        products = self.products
+        return [products[i] for i in positions]
+
+    def _ordered(self, positions: List[int], order: Iterable[int], rank: Optional[array]) -> List[int]:
+        if len(positions) == len(self.products):
+            return list(order)
+        # Большой результат дешевле отфильтровать по готовому порядку, маленький - отсортировать
+        if len(positions) * PRESORTED_WALK_FRACTION > len(self.products):
+            selected = bytearray(len(self.products))
+            for i in positions:
+                selected[i] = 1
+            return [i for i in order if selected[i]]
+        return sorted(positions, key=rank.__getitem__ if rank is not None else None)
+
+    def facets(
+        self,
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        buckets: int = FACET_PRICE_BUCKETS,
+    ) -> dict:
+        """Один проход по товарам, прошедшим все фильтры, кроме категории.
+
+        Счётчики категорий показывают, сколько товаров будет при выборе каждой из них;
+        гистограмма и total - по текущему фильтру целиком.
+        """
+        positions, _ = self._select(search, None, min_price, max_price)
+        code = self.category_code(category)
+        low, width = price_buckets(*self.price_range, buckets)
+        counts = [0] * len(self.category_names)
+        histogram = [0] * buckets
+        total = 0
+        codes, prices, last = self.codes, self.prices, buckets - 1
+        for i in positions:
+            product_code = codes[i]
+            counts[product_code] += 1
+            if code is None or product_code == code:
+                total += 1
+                histogram[min(int((prices[i] - low) / width), last)] += 1
+        return facet_result(self.category_names, counts, histogram, low, width, total)
+
+
+class ColumnarCatalog:
+    """Каталог в колонках NumPy: id и цена - массивы, категория - коды словаря,
+    названия - один непрерывный буфер со смещениями.
+
+    Фильтры считаются векторными булевыми масками, порядок - заранее посчитанным
+    argsort. Словари товаров собираются только для строк результата.
+    """
+
+    # Разделитель названий в буфере: в поисковом запросе его не бывает
+    SEPARATOR = "\x00"
+
+    def __init__(self, ids, names: List[str], category_names: List[str], codes, prices):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.category_names = list(category_names)
+        self.category_codes: Dict[str, int] = {}
+        for code, name in enumerate(self.category_names):
+            self.category_codes.setdefault(name.casefold(), code)
+        self.sorted_categories = sorted(self.category_names)
+        self.names, self.name_offsets = self._pack(names)
+        # casefold() может изменить длину строки, поэтому у буфера для поиска свои смещения
+        self.search_buffer, self.search_offsets = self._pack([name.casefold() for name in names])
+        self.price_asc = np.argsort(self.prices, kind="stable")
+        self.price_desc = np.argsort(-self.prices, kind="stable")
+        self.price_range = (float(self.prices.min()), float(self.prices.max())) if len(self.prices) else (0.0, 0.0)
+
+    @classmethod
+    def _pack(cls, names: List[str]):
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum([len(name) + 1 for name in names], out=offsets[1:])
+        return cls.SEPARATOR.join(names) + cls.SEPARATOR, offsets
+
+    @classmethod
+    def from_products(cls, products: Iterable[dict]) -> "ColumnarCatalog":
+        ids, names, codes, prices = [], [], [], []
+        category_codes: Dict[str, int] = {}
+        category_names: List[str] = []
+        for product in products:
+            ids.append(product["id"])
+            names.append(product["name"])
+            # Категории, отличающиеся только регистром, - одна категория, как и в Catalog
+            key = product["category"].casefold()
+            code = category_codes.get(key)
+            if code is None:
+                code = category_codes[key] = len(category_names)
+                category_names.append(product["category"])
+            codes.append(code)
+            prices.append(product["price"])
+        return cls(ids, names, category_names, codes, prices)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _search_mask(self, needle: str):
+        mask = np.zeros(len(self), dtype=bool)
+        if self.SEPARATOR in needle:
+            return mask
+        # str.find идёт по буферу на скорости C; смещения совпадений переводятся в строки через searchsorted
+        hits = []
+        buffer = self.search_buffer
+        position = buffer.find(needle)
+        while position != -1:
+            hits.append(position)
+            row_end = buffer.find(self.SEPARATOR, position)
+            position = buffer.find(needle, row_end + 1)
+        if hits:
+            mask[np.searchsorted(self.search_offsets, hits, side="right") - 1] = True
+        return mask
+
+    def category_code(self, category: Optional[str]) -> Optional[int]:
+        if not category or category.casefold() == "all":
+            return None
+        return self.category_codes.get(category.casefold(), -1)
+
+    def _mask(self, search, category, min_price, max_price):
+        """Булева маска фильтров; None - фильтров нет, подходят все строки."""
+        mask = None
+        code = self.category_code(category)
+        if code is not None:
+            mask = self.codes == code
+        if min_price is not None:
+            mask = self.prices >= min_price if mask is None else mask & (self.prices >= min_price)
+        if max_price is not None:
+            mask = self.prices <= max_price if mask is None else mask & (self.prices <= max_price)
+        if search:
+            search_mask = self._search_mask(search.casefold())
+            mask = search_mask if mask is None else mask & search_mask
+        return mask
+
+    def query(
+        self,
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: Optional[str] = None,
+    ) -> List[dict]:
+        mask = self._mask(search, category, min_price, max_price)
+        if sort == "price_asc":
+            rows = self.price_asc if mask is None else self.price_asc[mask[self.price_asc]]
+        elif sort == "price_desc":
+            rows = self.price_desc if mask is None else self.price_desc[mask[self.price_desc]]
+        else:
+            rows = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        return self.rows(rows)
+
+    def rows(self, rows) -> List[dict]:
+        # Колонки выбираются целиком через fancy indexing, в Python остаётся только сборка словарей
+        starts = self.name_offsets[rows].tolist()
+        ends = (self.name_offsets[rows + 1] - 1).tolist()
+        ids = self.ids[rows].tolist()
+        prices = self.prices[rows].tolist()
+        categories = self.category_names
+        codes = self.codes[rows].tolist()
+        names = self.names
+        return [
+            {"id": product_id, "name": names[start:end], "category": categories[code], "price": price}
+            for product_id, start, end, code, price in zip(ids, starts, ends, codes, prices)
+        ]
+
+    def facets(
+        self,
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        buckets: int = FACET_PRICE_BUCKETS,
+    ) -> dict:
+        mask = self._mask(search, None, min_price, max_price)
+        codes = self.codes if mask is None else self.codes[mask]
+        prices = self.prices if mask is None else self.prices[mask]
+        counts = np.bincount(codes, minlength=len(self.category_names))
+        code = self.category_code(category)
+        if code is not None:
+            prices = prices[codes == code]
+        low, width = price_buckets(*self.price_range, buckets)
+        # Та же формула корзины, что и в Catalog.facets, чтобы ответы совпадали
+        bucket = np.minimum(((prices - low) / width).astype(np.int64), buckets - 1)
+        histogram = np.bincount(bucket, minlength=buckets)
+        return facet_result(self.category_names, counts.tolist(), histogram.tolist(), low, width, len(prices))
+
+
+# --- Выбор реализации каталога: index (по умолчанию) или numpy ---
+CATALOG_BACKEND = os.getenv("CATALOG_BACKEND", "index")
+
+
+def build_catalog(products: Iterable[dict]):
+    if CATALOG_BACKEND == "numpy":
+        if np is not None:
+            return ColumnarCatalog.from_products(products)
+        print("CATALOG_BACKEND=numpy, but numpy is not installed; using the index catalog")
+    return Catalog(products)
+
+
+# --- Кэш результатов по нормализованному запросу ---
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+# Огромные выдачи не кэшируем: они вытеснили бы всё остальное, а собираются и так быстро
+QUERY_CACHE_MAX_ROWS = int(os.getenv("QUERY_CACHE_MAX_ROWS", "10000"))
+SORT_OPTIONS = ("price_asc", "price_desc")
+
+
+def normalize_query(search, category, min_price, max_price, sort=None) -> tuple:
+    """Разные записи одного и того же запроса дают один ключ: регистр, "all", пустой поиск,
+    неизвестная сортировка и 100 против 100.0 не плодят отдельных записей в кэше."""
+    search = search.casefold() if search else None
+    category = category.casefold() if category else None
+    if category == "all":
+        category = None
+    min_price = float(min_price) if min_price is not None else None
+    max_price = float(max_price) if max_price is not None else None
+    sort = sort if sort in SORT_OPTIONS else None
+    return search, category, min_price, max_price, sort
+
+
+class QueryCache:
+    """LRU на OrderedDict со счётчиками попаданий; сбрасывается при смене каталога."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+catalog = build_catalog(PRODUCTS_DB)
+products_cache = QueryCache(QUERY_CACHE_SIZE)
+facets_cache = QueryCache(QUERY_CACHE_SIZE)
+
+
+def replace_catalog(products: Iterable[dict]):
+    """Единственный способ сменить каталог: новый индекс строится целиком, кэши сбрасываются."""
+    global catalog
+    catalog = build_catalog(products)
+    products_cache.clear()
+    facets_cache.clear()
+
+
+# --- Pydantic модели фасетов ---
+class CategoryFacet(BaseModel):
+    name: str
+    count: int
+
+class PriceBucket(BaseModel):
+    min: float
+    max: float
+    count: int
+
+class Facets(BaseModel):
+    total: int
+    categories: List[CategoryFacet]
+    price_histogram: List[PriceBucket]
+
 # --- Эндпоинты API ---
 @app.get("/api/products", response_model=List[Product])
 async def filter_products(
     search: Optional[str] = None,
     category: Optional[str] = None,
-    min_price: Optional[float] = None,
-    max_price: Optional[float] = None,
+    # NaN ломал бы сравнения цен по-разному в каждом каталоге и засорял кэш
+    min_price: Optional[float] = Query(None, allow_inf_nan=False),
+    max_price: Optional[float] = Query(None, allow_inf_nan=False),
     sort: Optional[str] = None
 ):
-    filtered_products = PRODUCTS_DB
+    key = normalize_query(search, category, min_price, max_price, sort)
+    products = products_cache.get(key)
+    if products is None:
+        products = catalog.query(*key)
+        if len(products) <= QUERY_CACHE_MAX_ROWS:
+            products_cache.put(key, products)
+    return products
 
-    if category and category.lower() != "all":
-        filtered_products = [p for p in filtered_products if p["category"].lower() == category.lower()]
-
-    if search:
-        filtered_products = [p for p in filtered_products if search.lower() in p["name"].lower()]
-
-    if min_price is not None:
-        filtered_products = [p for p in filtered_products if p["price"] >= min_price]
-
-    if max_price is not None:
-        filtered_products = [p for p in filtered_products if p["price"] <= max_price]
-
-    if sort == "price_asc":
-        filtered_products.sort(key=lambda x: x["price"])
-    elif sort == "price_desc":
-        filtered_products.sort(key=lambda x: x["price"], reverse=True)
-
-    return filtered_products
+@app.get("/api/facets", response_model=Facets)
+async def get_facets(
+    search: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = Query(None, allow_inf_nan=False),
+    max_price: Optional[float] = Query(None, allow_inf_nan=False),
+):
+    """Количество товаров по категориям и гистограмма цен для текущего фильтра."""
+    key = normalize_query(search, category, min_price, max_price)[:4]
+    facets = facets_cache.get(key)
+    if facets is None:
+        facets = catalog.facets(*key)
+        facets_cache.put(key, facets)
+    return facets
 
 @app.get("/api/categories", response_model=List[str])
 async def get_categories():
     """Возвращает список уникальных категорий."""
-    categories = sorted(list(set(p["category"] for p in PRODUCTS_DB)))
-    return categories
\ No newline at end of file
+    return catalog.sorted_categories
+
+@app.get("/api/cache-stats")
+async def get_cache_stats():
+    """Заполненность кэшей и доля попаданий."""
+    return {"products": products_cache.stats(), "facets": facets_cache.stats()}
@@ -10,12 +10,20 @@ interface Product {
   price: number;
 }
 
+interface CategoryFacet {
+  name: string;
+  count: number;
+}
+
 const API_URL = 'http://localhost:8000/api';
 
 export default function Home() {
   // Состояния для данных
   const [products, setProducts] = useState<Product[]>([]);
   const [categories, setCategories] = useState<string[]>([]);
+  // Сколько товаров будет в каждой категории при остальных текущих фильтрах
+  const [categoryCounts, setCategoryCounts] = useState<Record<string, number>>({});
+  const [total, setTotal] = useState(0);
 
   // Состояния для фильтров
   const [searchTerm, setSearchTerm] = useState('');
@@ -54,8 +62,18 @@ useEffect(() => {
         if (minPrice) params.append('min_price', minPrice);
         if (maxPrice) params.append('max_price', maxPrice);
 
-        const response = await axios.get(`${API_URL}/products?${params.toString()}`);
+        // Фасеты не зависят от сортировки, поэтому sort в них не передаём
+        const facetParams = new URLSearchParams(params);
+        facetParams.delete('sort');
+        const [response, facets] = await Promise.all([
+          axios.get(`${API_URL}/products?${params.toString()}`),
+          axios.get(`${API_URL}/facets?${facetParams.toString()}`),
+        ]);
         setProducts(response.data);
+        setTotal(facets.data.total);
+        setCategoryCounts(
+          Object.fromEntries(facets.data.categories.map((c: CategoryFacet) => [c.name, c.count]))
+        );
       } catch (error) {
         console.error('Failed to fetch products:', error);
       } finally {
@@ -92,7 +110,9 @@ useEffect(() => {
     className="p-2 border rounded-md w-full"
   >
     {categories.map(cat => (
-      <option key={cat} value={cat}>{cat}</option>
+      <option key={cat} value={cat}>
+        {cat in categoryCounts ? `${cat} (${categoryCounts[cat]})` : cat}
+      </option>
     ))}
   </select>
   <select
@@ -140,6 +160,8 @@ useEffect(() => {
           </select>
         </div>
 
+        {!loading && <p className="text-gray-600 mb-4">Найдено товаров: {total}</p>}
+
         {/* Сетка товаров */}
         {loading ? (
           <p className="text-center">Загрузка товаров...</p>
@@ -0,0 +1,101 @@
+"""Пропускная способность проверки подписанных токенов в нескольких процессах.
+
+Запуск из папки backend:
+    python bench_tokens.py --tokens 10000 --revoked 0.01 --workers 1 2 4 --seconds 3
+
+Родительский процесс выдаёт токены и отзывает часть из них, затем каждый воркер -
+отдельный процесс, как воркер uvicorn, - импортирует main с тем же ключом и той же
+базой отзывов и проверяет чужие токены по кругу. Для сравнения печатается проверка
+в режиме memory (поиск в словаре), которая работает только внутри одного процесса.
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+import multiprocessing
+
+# Общие для всех процессов ключ и база отзывов - так же, как у нескольких воркеров uvicorn
+os.environ["AUTH_TOKEN_MODE"] = "signed"
+os.environ.setdefault("AUTH_SECRET", "bench-secret")
+os.environ.setdefault("AUTH_DENYLIST_DB", os.path.join(tempfile.mkdtemp(), "revoked.db"))
+
+
+def verify_loop(tokens, seconds: float, results):
+    import main  # в дочернем процессе: свой фильтр Блума, загруженный из общей базы
+
+    store = main.token_store
+    verified = rejected = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for token in tokens:
+            if store.get(token) is None:
+                rejected += 1
+            else:
+                verified += 1
+    elapsed = time.perf_counter() - start
+    results.put((verified, rejected, elapsed, store.db_lookups))
+
+
+def run_workers(tokens, workers: int, seconds: float):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=verify_loop, args=(tokens, seconds, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return collected
+
+
+def memory_baseline(count: int, seconds: float) -> float:
+    import main
+
+    store = main.TokenStore(count, main.TOKEN_LIFETIME)
+    tokens = [store.issue("user", "user") for _ in range(count)]
+    done = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for token in tokens:
+            store.get(token)
+        done += len(tokens)
+    return done / (time.perf_counter() - start)
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=10000)
+    parser.add_argument("--revoked", type=float, default=0.01, help="доля отозванных токенов")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    import main
+
+    store = main.token_store
+    tokens = [store.issue("user", "user") for _ in range(args.tokens)]
+    revoked = int(args.tokens * args.revoked)
+    for token in tokens[:revoked]:
+        store.revoke(token)
+
+    print(f"tokens={args.tokens} revoked={revoked} cpus={os.cpu_count()}")
+    print(f"memory mode, 1 process: {memory_baseline(args.tokens, args.seconds):,.0f} verifications/s")
+    print(f"{'workers':>7} {'total/s':>12} {'per worker/s':>13} {'db lookups':>11}")
+    for workers in args.workers:
+        collected = run_workers(tokens, workers, args.seconds)
+        for verified, rejected, _, _ in collected:
+            # Каждый воркер должен отклонить ровно отозванные токены - иначе цифры бессмысленны
+            rounds = (verified + rejected) // args.tokens
+            if rejected != rounds * revoked:
+                print(f"unexpected rejections in a worker: {rejected} for {rounds} rounds")
+                sys.exit(1)
+        total = sum((verified + rejected) / elapsed for verified, rejected, elapsed, _ in collected)
+        lookups = sum(lookups for _, _, _, lookups in collected)
+        print(f"{workers:>7} {total:>12,.0f} {total / workers:>13,.0f} {lookups:>11,}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -2,11 +2,33 @@ from fastapi import FastAPI, Depends, HTTPException, status, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from typing import Annotated, Dict
-from datetime import datetime, timedelta
+from typing import Annotated, Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import timedelta
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import math
+import secrets
+import sqlite3
+import time
 import uuid
+import os
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sweeper = asyncio.create_task(run_token_sweeper())
+    try:
+        yield
+    finally:
+        sweeper.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # --- CORS настройки ---
 origins = ["http://localhost:3000"]
@@ -25,8 +47,293 @@ FAKE_USERS = {
 }
 
 # --- Хранилище токенов ---
-ACTIVE_TOKENS: Dict[str, Dict] = {}  # token -> {username, role, created_at}
 TOKEN_LIFETIME = timedelta(hours=1)
+# Жёсткий предел числа активных токенов: при переполнении вытесняется самый старый
+MAX_ACTIVE_TOKENS = int(os.getenv("AUTH_MAX_TOKENS", "100000"))
+# Как часто фоновая задача убирает истёкшие токены, секунды
+TOKEN_SWEEP_INTERVAL = float(os.getenv("AUTH_SWEEP_INTERVAL", "60"))
+# Сколько токенов показывать в /api/debug-tokens
+DEBUG_TOKENS_SAMPLE = 20
+
+
+class TokenRecord:
+    # Без __dict__ на каждый токен: три поля вместо словаря
+    __slots__ = ("username", "role", "expires_at")
+
+    def __init__(self, username: str, role: str, expires_at: float):
+        self.username = username
+        self.role = role
+        self.expires_at = expires_at  # по time.monotonic() в обоих режимах
+
+
+class TokenStore:
+    """Токены в порядке выдачи. Срок жизни у всех одинаковый, поэтому порядок выдачи -
+    это и порядок истечения: истёкшие и самые старые всегда лежат в начале OrderedDict.
+
+    Очистка снимает истёкшие с начала за O(число истёкших), вытеснение при переполнении
+    снимает самый старый за O(1).
+    """
+
+    def __init__(self, capacity: int, lifetime: timedelta):
+        self.sweep_interval = TOKEN_SWEEP_INTERVAL
+        self.capacity = capacity
+        self.lifetime = lifetime.total_seconds()
+        self.tokens: OrderedDict = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def issue(self, username: str, role: str) -> str:
+        while len(self.tokens) >= self.capacity:
+            self.tokens.popitem(last=False)
+            self.evicted += 1
+        token = str(uuid.uuid4())
+        self.tokens[token] = TokenRecord(username, role, time.monotonic() + self.lifetime)
+        return token
+
+    def get(self, token: str) -> Optional[TokenRecord]:
+        """Запись токена; None, если его нет. Истёкший токен удаляется и тоже даёт None."""
+        record = self.tokens.get(token)
+        if record is not None and record.expires_at <= time.monotonic():
+            del self.tokens[token]
+            self.expired += 1
+            return None
+        return record
+
+    def revoke(self, token: str):
+        self.tokens.pop(token, None)
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        removed = 0
+        while self.tokens:
+            token, record = next(iter(self.tokens.items()))
+            if record.expires_at > now:
+                break
+            del self.tokens[token]
+            removed += 1
+        self.expired += removed
+        return removed
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        sample = []
+        for token, record in self.tokens.items():
+            if len(sample) >= DEBUG_TOKENS_SAMPLE:
+                break
+            sample.append({
+                "token": f"{token[:8]}...",
+                "username": record.username,
+                "role": record.role,
+                "expires_in": round(record.expires_at - now),
+            })
+        return {
+            "mode": "memory",
+            "active": len(self.tokens),
+            "capacity": self.capacity,
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "oldest": sample,
+        }
+
+
+# --- Подписанные токены: без хранилища, годятся для нескольких воркеров ---
+# memory - токены в памяти процесса (по умолчанию), signed - HMAC-подписанные токены
+TOKEN_MODE = os.getenv("AUTH_TOKEN_MODE", "memory")
+# Общий для всех воркеров ключ подписи; если не задан, берётся из файла (создаётся при первом запуске)
+AUTH_SECRET = os.getenv("AUTH_SECRET", "")
+AUTH_SECRET_FILE = os.getenv("AUTH_SECRET_FILE", "auth_secret.key")
+# Список отозванных токенов, общий для воркеров
+DENYLIST_DB = os.getenv("AUTH_DENYLIST_DB", "revoked.db")
+# Как часто воркер подтягивает чужие отзывы в свой фильтр Блума, секунды
+DENYLIST_REFRESH_INTERVAL = float(os.getenv("AUTH_DENYLIST_REFRESH", "1"))
+DENYLIST_CAPACITY = int(os.getenv("AUTH_DENYLIST_CAPACITY", "100000"))
+DENYLIST_FALSE_POSITIVE_RATE = 0.01
+
+
+def load_secret() -> bytes:
+    if AUTH_SECRET:
+        return AUTH_SECRET.encode()
+    # Ключ пишется во временный файл и публикуется через link: воркеры, стартующие
+    # одновременно, либо создают файл, либо читают уже полностью записанный чужой
+    temp_path = f"{AUTH_SECRET_FILE}.{os.getpid()}.tmp"
+    # Права 0600 задаются при создании: ключ не должен быть читаем другим пользователям
+    if os.path.exists(temp_path):
+        os.remove(temp_path)  # остался от упавшего процесса с тем же pid
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(secrets.token_hex(32))
+    try:
+        os.link(temp_path, AUTH_SECRET_FILE)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(temp_path)
+    with open(AUTH_SECRET_FILE) as f:
+        return f.read().strip().encode()
+
+
+def b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class BloomFilter:
+    """Битовый массив под ожидаемое число отозванных токенов. Промах означает «точно
+    не отозван», попадание - «возможно отозван», его проверяет база."""
+
+    def __init__(self, size_bits: int, num_hashes: int):
+        self.size_bits = size_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray((size_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, false_positive_rate: float) -> "BloomFilter":
+        size_bits = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        num_hashes = max(1, round(size_bits / capacity * math.log(2)))
+        return cls(size_bits, num_hashes)
+
+    def _positions(self, digest: bytes):
+        # Двойное хэширование: jti случайный, поэтому его половины и есть два хэша
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return [(h1 + i * h2) % self.size_bits for i in range(self.num_hashes)]
+
+    def add(self, digest: bytes):
+        for p in self._positions(digest):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(digest))
+
+
+class SignedTokens:
+    """Токен - base64url(JSON [username, role, exp, jti]) + "." + HMAC-SHA256 подпись.
+
+    Проверка не ходит ни в какое хранилище: подпись, срок и фильтр Блума отозванных jti.
+    Только при попадании в фильтр (отозван или ложное срабатывание) читается SQLite.
+    Отзыв в своём воркере действует сразу, в остальных - после ближайшего обновления
+    фильтра (DENYLIST_REFRESH_INTERVAL).
+    """
+
+    def __init__(self, secret: bytes, lifetime: timedelta, db_path: str):
+        self.secret = secret
+        self.lifetime = lifetime.total_seconds()
+        self.sweep_interval = DENYLIST_REFRESH_INTERVAL
+        self.db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS revoked ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, jti BLOB UNIQUE NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.last_seq = 0
+        self.bloom = None
+        self.checks = 0
+        self.db_lookups = 0
+        self.false_positives = 0
+        self._rebuild_filter()
+
+    def _sign(self, payload: str) -> str:
+        return b64encode(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, username: str, role: str) -> str:
+        expires_at = int(time.time() + self.lifetime)
+        jti = secrets.token_bytes(16)
+        payload = b64encode(json.dumps([username, role, expires_at, jti.hex()], separators=(",", ":")).encode())
+        return f"{payload}.{self._sign(payload)}"
+
+    def _decode(self, token: str):
+        """(username, role, exp, jti) для токена с верной подписью, иначе None. Срок не проверяется."""
+        payload, _, signature = token.partition(".")
+        try:
+            # Сравниваются байты: compare_digest на не-ASCII строке бросает TypeError
+            if not signature or not hmac.compare_digest(signature.encode(), self._sign(payload).encode()):
+                return None
+            username, role, expires_at, jti = json.loads(b64decode(payload))
+            return username, role, expires_at, bytes.fromhex(jti)
+        except (ValueError, TypeError):
+            return None
+
+    def get(self, token: str) -> Optional[TokenRecord]:
+        decoded = self._decode(token)
+        if decoded is None:
+            return None
+        username, role, expires_at, jti = decoded
+        now = time.time()
+        if expires_at <= now or self.is_revoked(jti):
+            return None
+        # В токене exp по часам стены; в записи - по monotonic, как у TokenStore
+        return TokenRecord(username, role, time.monotonic() + (expires_at - now))
+
+    def is_revoked(self, jti: bytes) -> bool:
+        self.checks += 1
+        if jti not in self.bloom:
+            return False
+        self.db_lookups += 1
+        revoked = self.db.execute("SELECT 1 FROM revoked WHERE jti = ?", (jti,)).fetchone() is not None
+        if not revoked:
+            self.false_positives += 1
+        return revoked
+
+    def revoke(self, token: str):
+        decoded = self._decode(token)
+        if decoded is None:
+            return
+        _, _, expires_at, jti = decoded
+        self.db.execute("INSERT OR IGNORE INTO revoked (jti, expires_at) VALUES (?, ?)", (jti, expires_at))
+        self.bloom.add(jti)
+
+    def _rebuild_filter(self):
+        rows = self.db.execute("SELECT seq, jti FROM revoked").fetchall()
+        bloom = BloomFilter.for_capacity(max(DENYLIST_CAPACITY, 2 * len(rows)), DENYLIST_FALSE_POSITIVE_RATE)
+        for seq, jti in rows:
+            bloom.add(jti)
+            self.last_seq = max(self.last_seq, seq)
+        self.bloom = bloom
+
+    def sweep(self) -> int:
+        """Подтягивает отзывы других воркеров и выбрасывает записи уже истёкших токенов."""
+        for seq, jti in self.db.execute("SELECT seq, jti FROM revoked WHERE seq > ?", (self.last_seq,)):
+            self.bloom.add(jti)
+            self.last_seq = seq
+        removed = self.db.execute("DELETE FROM revoked WHERE expires_at <= ?", (time.time(),)).rowcount
+        # Из фильтра Блума удалять нельзя - после чистки базы он строится заново
+        if removed:
+            self._rebuild_filter()
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "mode": "signed",
+            "revoked": self.db.execute("SELECT COUNT(*) FROM revoked").fetchone()[0],
+            "bloom_bits": self.bloom.size_bits,
+            "checks": self.checks,
+            "db_lookups": self.db_lookups,
+            "false_positives": self.false_positives,
+        }
+
+
+def build_token_store():
+    if TOKEN_MODE == "signed":
+        return SignedTokens(load_secret(), TOKEN_LIFETIME, DENYLIST_DB)
+    return TokenStore(MAX_ACTIVE_TOKENS, TOKEN_LIFETIME)
+
+
+token_store = build_token_store()
+
+
+async def run_token_sweeper():
+    while True:
+        await asyncio.sleep(token_store.sweep_interval)
+        try:
+            token_store.sweep()
+        except Exception as e:
+            print(f"Token sweep failed: {e}")
 
 
 # --- Модель ответа с токеном ---
@@ -41,21 +348,17 @@ async def token_verifier(authorization: Annotated[str, Header()]):
         raise HTTPException(status_code=401, detail="Invalid authentication scheme")
 
     token = authorization.split(" ")[1]
-    token_data = ACTIVE_TOKENS.get(token)
+    token_data = token_store.get(token)
 
-    if not token_data:
+    if token_data is None:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-    if datetime.utcnow() - token_data["created_at"] > TOKEN_LIFETIME:
-        del ACTIVE_TOKENS[token]
-        raise HTTPException(status_code=401, detail="Token expired")
-
     return token_data  # содержит username и role
 
 
 # --- Зависимость: проверка роли ---
 def require_admin(user_info=Depends(token_verifier)):
-    if user_info["role"] != "admin":
+    if user_info.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access only")
     return user_info
 
@@ -68,12 +371,7 @@ async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
     if not user or user["password"] != form_data.password:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
 
-    token = str(uuid.uuid4())
-    ACTIVE_TOKENS[token] = {
-        "username": user["username"],
-        "role": user["role"],
-        "created_at": datetime.utcnow(),
-    }
+    token = token_store.issue(user["username"], user["role"])
 
     return {"access_token": token, "token_type": "bearer"}
 
@@ -82,19 +380,20 @@ async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
 @app.get("/api/secret-data")
 async def secret_data(user_info=Depends(token_verifier)):
     return {
-        "message": f"Привет, {user_info['username']}! Секретное сообщение: 42.",
-        "role": user_info["role"]
+        "message": f"Привет, {user_info.username}! Секретное сообщение: 42.",
+        "role": user_info.role
     }
 
 
 # --- Эндпоинт: только для админов ---
 @app.get("/api/admin-data")
 async def admin_data(user_info=Depends(require_admin)):
-    return {"message": f"Привет, {user_info['username']}! Ты админ, вот твои данные."}
+    return {"message": f"Привет, {user_info.username}! Ты админ, вот твои данные."}
 
+# Только счётчики (и в режиме memory - несколько самых старых записей с обрезанными токенами)
 @app.get("/api/debug-tokens")
 async def debug_tokens():
-    return ACTIVE_TOKENS
+    return token_store.stats()
 
 # --- Эндпоинт: выход и удаление токена ---
 @app.post("/api/logout")
@@ -103,6 +402,6 @@ async def logout(authorization: Annotated[str, Header()]):
         raise HTTPException(status_code=401, detail="Invalid authentication scheme")
 
     token = authorization.split(" ")[1]
-    ACTIVE_TOKENS.pop(token, None)
+    token_store.revoke(token)
 
     return {"message": "Logged out"}
\ No newline at end of file